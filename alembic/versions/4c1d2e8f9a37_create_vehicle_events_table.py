@@ -0,0 +1,49 @@
+"""create vehicle_events table
+
+Revision ID: 4c1d2e8f9a37
+Revises: 0be118b71755
+Create Date: 2026-10-18 10:12:44.318203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1d2e8f9a37'
+down_revision: Union[str, Sequence[str], None] = '0be118b71755'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('vehicle_events',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('event', sa.String(length=16), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('camera_id', sa.String(length=64), nullable=True),
+    sa.Column('vehicle_id', sa.Integer(), nullable=True),
+    sa.Column('vehicle_class', sa.String(length=32), nullable=True),
+    sa.Column('confidence_score', sa.Float(), nullable=True),
+    sa.Column('zone', sa.String(length=64), nullable=True),
+    sa.Column('direction', sa.String(length=16), nullable=True),
+    sa.Column('time_in', sa.String(length=8), nullable=True),
+    sa.Column('time_out', sa.String(length=8), nullable=True),
+    sa.Column('speed_ms', sa.Float(), nullable=True),
+    sa.Column('detected_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_vehicle_events_day'), 'vehicle_events', ['day'], unique=False)
+    op.create_index(op.f('ix_vehicle_events_camera_id'), 'vehicle_events', ['camera_id'], unique=False)
+    op.create_index(op.f('ix_vehicle_events_detected_at'), 'vehicle_events', ['detected_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_vehicle_events_detected_at'), table_name='vehicle_events')
+    op.drop_index(op.f('ix_vehicle_events_camera_id'), table_name='vehicle_events')
+    op.drop_index(op.f('ix_vehicle_events_day'), table_name='vehicle_events')
+    op.drop_table('vehicle_events')
@@ -0,0 +1,146 @@
+"""
+  Compares the detector backends (ultralytics, onnxruntime, openvino) on the same frames.
+
+  Frames come from a video file or a directory of images and are resized to the pipeline's
+  480x270 like the livestream does. Every backend loads the same model and runs the frames at
+  each batch size, reporting load time, per-frame latency (mean/p50/p95) and throughput, plus
+  how well its detections agree with the first backend listed (same class, IoU >= 0.5).
+
+  Run from the project root:
+    python scripts/benchmark_detectors.py recordings/c4-road.mp4
+    python scripts/benchmark_detectors.py recordings/frames/ --backends onnxruntime openvino --threads 4 --batch-sizes 1 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.traffic_ai.vehicle_detection.detector import DETECTOR_BACKENDS, MODEL_PATH, create_detector, detector_options
+from src.traffic_ai.vehicle_detection.roi import FRAME_SIZE
+
+
+def load_frames(path, limit):
+  """Up to `limit` frames of a video file or image directory, resized to the pipeline frame size"""
+  frames = []
+  if os.path.isdir(path):
+    for name in sorted(os.listdir(path)):
+      frame = cv2.imread(os.path.join(path, name))
+      if frame is not None:
+        frames.append(cv2.resize(frame, FRAME_SIZE))
+      if len(frames) >= limit:
+        break
+  else:
+    cap = cv2.VideoCapture(path)
+    while len(frames) < limit:
+      ret, frame = cap.read()
+      if not ret:
+        break
+      frames.append(cv2.resize(frame, FRAME_SIZE))
+    cap.release()
+  if not frames:
+    raise SystemExit(f"No frames read from {path}")
+  return frames
+
+
+def box_iou(a, b):
+  """IoU matrix of two (N, 4) and (M, 4) xyxy arrays"""
+  x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+  y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+  x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+  y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+  inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+  area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+  area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+  return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def agreement(reference, results, iou_threshold=0.5):
+  """Fraction of the reference detections matched by a same-class detection with IoU >= threshold"""
+  matched, total = 0, 0
+  for ref, boxes in zip(reference, results):
+    total += len(ref)
+    if len(ref) == 0 or len(boxes) == 0:
+      continue
+    iou = box_iou(ref[:, :4], boxes[:, :4])
+    iou[ref[:, None, 5] != boxes[None, :, 5]] = 0
+    matched += int(np.count_nonzero(iou.max(axis=1) >= iou_threshold))
+  return round(matched / total, 4) if total else None
+
+
+def benchmark(detector, frames, batch_size, repeats):
+  """Per-frame latencies in ms over `repeats` passes, and the detections of the last pass"""
+  latencies, results = [], []
+  for _ in range(repeats):
+    results = []
+    for start in range(0, len(frames), batch_size):
+      batch = frames[start:start + batch_size]
+      started = time.perf_counter()
+      results.extend(detector.predict(batch))
+      latencies.append((time.perf_counter() - started) * 1000 / len(batch))
+  return np.asarray(latencies), results
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Compare detector backends on the same frames")
+  parser.add_argument("source", help="Video file or directory of frames")
+  parser.add_argument("--model", default=MODEL_PATH, help="Model used by every backend, or a model variant (fp32, int8)")
+  parser.add_argument("--backends", nargs="+", choices=DETECTOR_BACKENDS, default=list(DETECTOR_BACKENDS))
+  parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+  parser.add_argument("--threads", type=int, help="Intra-op threads of the onnxruntime/openvino backends")
+  parser.add_argument("--frames", type=int, default=200, help="Frames to read from the source")
+  parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the frames")
+  parser.add_argument("--warmup", type=int, default=5, help="Untimed inferences after loading")
+  parser.add_argument("--json", help="Also write the results to this file")
+  args = parser.parse_args()
+
+  frames = load_frames(args.source, args.frames)
+  print(f"{len(frames)} frames from {args.source}, model {args.model}\n")
+  print(f"{'backend':<13}{'batch':>6}{'load s':>8}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'fps':>8}"
+        f"{'det/frame':>10}{'agreement':>11}")
+
+  rows, reference = [], None
+  for backend in args.backends:
+    options = detector_options(backend, args.threads)
+    try:
+      started = time.perf_counter()
+      detector = create_detector(backend, args.model, **options)
+      load_seconds = time.perf_counter() - started
+    except Exception as e:
+      print(f"{backend:<13} could not load: {e}")
+      continue
+
+    for _ in range(args.warmup):
+      detector.predict(frames[:1])
+
+    for batch_size in args.batch_sizes:
+      latencies, results = benchmark(detector, frames, batch_size, args.repeats)
+      if reference is None:
+        reference = results
+      row = {
+        "backend": backend,
+        "batch_size": batch_size,
+        "load_seconds": round(load_seconds, 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "fps": round(1000 / float(latencies.mean()), 2),
+        "detections_per_frame": round(sum(len(r) for r in results) / len(results), 3),
+        "agreement": agreement(reference, results),
+      }
+      rows.append(row)
+      agreement_text = "-" if row["agreement"] is None else f"{row['agreement']:.3f}"
+      print(f"{backend:<13}{batch_size:>6}{row['load_seconds']:>8.2f}{row['mean_ms']:>9.2f}{row['p50_ms']:>9.2f}"
+            f"{row['p95_ms']:>9.2f}{row['fps']:>8.1f}{row['detections_per_frame']:>10.2f}{agreement_text:>11}")
+
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump({"source": args.source, "model": args.model, "frames": len(frames), "results": rows}, f, indent=2)
+    print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,307 @@
+"""
+  Replays a recorded video (or a directory of frames) through the detection pipeline: the same
+  capture -> inference -> annotation threads the livestream runs, with Firebase left out
+  (persist=False) so nothing is read from or written to the live database.
+
+  By default the replay is lossless and unpaced: the stage queues wait for the slower stage instead
+  of dropping frames and the scheduler ignores the measured cost, so the counts do not depend on
+  how fast the machine or engine is and runs can be compared. --drop-frames replays with the live
+  drop-oldest queues instead, fed at the recording's frame rate (--speed 2 for twice as fast), to
+  see what a camera would lose on this machine. Frame times are taken from the recording's frame
+  rate, so the scheduler and motion gate pick the frames they would pick live. Reports the frames
+  detected and annotated per second, per-stage latency, drops and the final per-class counts,
+  compared with a ground truth file when one is given. --event-sinks writes the crossings and exits
+  to local sinks as well (see event_sinks.py), e.g. to check what lands in them.
+
+  Ground truth is a JSON object of per-class counts, e.g. {"car": 41, "motorbike": 17, "truck": 3}
+
+  Run from the project root:
+    python scripts/benchmark_pipeline.py recordings/c4-road.mp4 --ground-truth recordings/c4-road.json
+    python scripts/benchmark_pipeline.py recordings/frames/ --fps 15 --detect-every-frame --json report.json
+    python scripts/benchmark_pipeline.py recordings/c4-road.mp4 --event-sinks sqlite:///cache/replay_events.db
+    python scripts/benchmark_pipeline.py recordings/c4-road.mp4 --drop-frames --speed 1
+
+  Counts with and without the motion gate should match, compare a run with --no-motion-gating.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.traffic_ai.vehicle_detection.detector import DETECTOR_BACKENDS, MODEL_PATH, create_detector, detector_options
+from src.traffic_ai.vehicle_detection.roi import FRAME_SIZE
+from src.traffic_ai.vehicle_detection.vehicle_counter import OptimizedDetectionPipeline, stop_event_dispatchers
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameDirectorySource:
+  """Minimal cv2.VideoCapture stand-in reading the images of a directory in file name order"""
+
+  def __init__(self, directory, fps):
+    self.paths = sorted(
+      os.path.join(directory, name) for name in os.listdir(directory)
+      if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    self.fps = fps
+    self.position = 0
+
+  def isOpened(self):
+    return bool(self.paths)
+
+  def read(self):
+    while self.position < len(self.paths):
+      frame = cv2.imread(self.paths[self.position])
+      self.position += 1
+      if frame is not None:
+        return True, frame
+    return False, None
+
+  def get(self, prop):
+    if prop == cv2.CAP_PROP_FPS:
+      return self.fps
+    if prop == cv2.CAP_PROP_FRAME_COUNT:
+      return len(self.paths)
+    return 0
+
+  def set(self, prop, value):
+    return False
+
+  def release(self):
+    self.position = len(self.paths)
+
+
+class PacedSource:
+  """Wraps an opened source, delivering its frames at `speed` times `fps` (0: unpaced) and at most `max_frames`"""
+
+  def __init__(self, source, fps, speed=1.0, max_frames=0):
+    self.source = source
+    self.interval = 1 / (fps * speed) if speed > 0 else 0
+    self.max_frames = max_frames
+    self.frames = 0
+    self.next_time = None
+
+  def isOpened(self):
+    return self.source.isOpened()
+
+  def read(self):
+    if self.max_frames and self.frames >= self.max_frames:
+      return False, None
+    if self.interval:
+      now = time.perf_counter()
+      self.next_time = max(self.next_time or now, now - self.interval)
+      if self.next_time > now:
+        time.sleep(self.next_time - now)
+      self.next_time += self.interval
+    self.frames += 1
+    return self.source.read()
+
+  def get(self, prop):
+    return self.source.get(prop)
+
+  def set(self, prop, value):
+    return False
+
+  def release(self):
+    self.source.release()
+
+
+def open_source(path, fps=None):
+  """Opened source and its frame rate, --fps overrides the rate stored in a video file"""
+  if os.path.isdir(path):
+    source = FrameDirectorySource(path, fps or 30.0)
+  else:
+    source = cv2.VideoCapture(path)
+  if not source.isOpened():
+    raise SystemExit(f"Cannot open {path}")
+  return source, fps or source.get(cv2.CAP_PROP_FPS) or 30.0
+
+
+def load_json(path):
+  if not path:
+    return None
+  with open(path, encoding="utf-8") as f:
+    return json.load(f)
+
+
+def compare_counts(counted, expected):
+  """Per-class counted vs expected counts, plus the total absolute error and count accuracy"""
+  expected = expected.get("by_class", expected)
+  classes = sorted(set(counted) | set(expected))
+  rows = {
+    name: {
+      "expected": int(expected.get(name, 0)),
+      "counted": int(counted.get(name, 0)),
+      "error": int(counted.get(name, 0)) - int(expected.get(name, 0)),
+    }
+    for name in classes
+  }
+  expected_total = sum(row["expected"] for row in rows.values())
+  abs_error = sum(abs(row["error"]) for row in rows.values())
+  return {
+    "by_class": rows,
+    "expected_total": expected_total,
+    "counted_total": sum(row["counted"] for row in rows.values()),
+    "abs_error": abs_error,
+    "accuracy": round(max(0.0, 1 - abs_error / expected_total), 4) if expected_total else None,
+  }
+
+
+def run(args):
+  source, fps = open_source(args.source, args.fps)
+  detector = create_detector(args.backend, args.model, **detector_options(args.backend, args.threads))
+
+  # Model load and the first inferences (graph optimization, allocations) are not part of the run
+  blank = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+  for _ in range(args.warmup):
+    detector.predict([blank] * args.batch_size)
+
+  pipeline = OptimizedDetectionPipeline(
+    PacedSource(source, fps, args.speed, args.max_frames), "processed", args.batch_size, camera_id="replay", detector=detector,
+    counting_zones=load_json(args.zones), roi=load_json(args.roi), target_fps=args.target_fps,
+    motion_gating=not args.no_motion_gating, persist=bool(args.event_sinks), replay_fps=fps,
+    event_sinks=args.event_sinks, lossless=not args.drop_frames
+  )
+  if args.detect_every_frame:
+    pipeline.scheduler.max_skip = 1
+
+  # The pipeline's own threads do the work, the run ends once the last frame went through all of them
+  output = io.StringIO() if args.quiet else sys.stdout
+  with contextlib.redirect_stdout(output):
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    while not pipeline.stream_ended.wait(0.2):
+      if not thread.is_alive():
+        raise SystemExit("Pipeline initialization failed")
+    elapsed = time.perf_counter() - started
+    pipeline.stop()
+    thread.join(timeout=10)
+  # Writes what the sinks still buffer, vehicles in view at the end never exit
+  stop_event_dispatchers()
+  sinks = pipeline.events.status() if pipeline.events is not None else {}
+
+  metrics = pipeline.metrics.snapshot()
+  counters = metrics["counters"]
+  frames = pipeline.frame_count
+  # Frames that went through detection and annotation, the others were skipped or dropped
+  annotated = metrics["stages"].get("update_tracking", {}).get("count", 0)
+  report = {
+    "source": args.source,
+    "backend": args.backend,
+    "model": args.model,
+    "source_fps": round(fps, 2),
+    "settings": {
+      "speed": args.speed,
+      "lossless": pipeline.lossless,
+      "threads": args.threads,
+      "batch_size": args.batch_size,
+      "target_fps": args.target_fps,
+      "motion_gating": not args.no_motion_gating,
+      "detect_every_frame": args.detect_every_frame,
+      "roi": pipeline.roi.to_config() if pipeline.roi is not None else None,
+    },
+    "frames": frames,
+    "frames_annotated": annotated,
+    "seconds": round(elapsed, 3),
+    "fps": round(annotated / elapsed, 2) if elapsed else None,
+    "detected_fps": round(counters.get("frames_detected", 0) / elapsed, 2) if elapsed else None,
+    "captured_fps": round(frames / elapsed, 2) if elapsed else None,
+    "realtime_factor": round(frames / elapsed / fps, 2) if elapsed else None,
+    "drops": {
+      name: counters.get(name, 0)
+      for name in ("capture_queue_dropped", "result_queue_dropped", "frames_scheduler_skipped", "frames_motion_gated")
+    },
+    "stages": metrics["stages"],
+    "counters": counters,
+    "counts": dict(pipeline.vehicle_class_counts),
+    "zones": pipeline.zone_counter.snapshot(),
+    "motion_gate": pipeline.motion_gate.status() if pipeline.motion_gate is not None else None,
+    "event_sinks": sinks,
+  }
+  ground_truth = load_json(args.ground_truth)
+  if ground_truth is not None:
+    report["accuracy"] = compare_counts(report["counts"], ground_truth)
+  return report
+
+
+def print_report(report):
+  print(f"\n{report['source']} ({report['source_fps']} fps) with {report['model']} on {report['backend']}")
+  mode = "lossless" if report["settings"]["lossless"] else "live drop-oldest queues"
+  print(f"{report['frames']} frames in {report['seconds']:.1f} s ({mode}, {report['realtime_factor']}x real time): "
+        f"{report['frames_annotated']} detected and annotated, {report['fps']} fps, "
+        f"YOLO on {report['detected_fps']} frames/s")
+
+  print(f"\n{'stage':<22}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'total s':>10}")
+  for name, stats in sorted(report["stages"].items(), key=lambda item: -item[1]["sum_ms"]):
+    print(f"{name:<22}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+          f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['sum_ms'] / 1000:>10.2f}")
+
+  print("\ncounters: " + ", ".join(f"{name}={value}" for name, value in sorted(report["counters"].items())))
+  for zone in report["zones"]:
+    print(f"zone {zone['name']}: {zone['inbound']} inbound, {zone['outbound']} outbound, {zone['by_class']}")
+  gate = report["motion_gate"]
+  if gate is not None:
+    print(f"motion gate: {gate['checked']} idle frames checked, {gate['skipped']} skipped ({gate['skipped_ratio']:.1%})")
+  for name, stats in report["event_sinks"].items():
+    print(f"sink {name}: {stats['written']} events written, {stats['dropped']} dropped, {stats['pending']} pending")
+
+  # Queue drops make counts depend on the machine, skips and gating are the scheduler's choices
+  print("\ndrops: " + ", ".join(f"{name}={value}" for name, value in report["drops"].items()))
+  accuracy = report.get("accuracy")
+  if accuracy is None:
+    print("counts: " + ", ".join(f"{name}={count}" for name, count in sorted(report["counts"].items())))
+    return
+  print(f"\n{'class':<12}{'expected':>10}{'counted':>10}{'error':>8}")
+  for name, row in accuracy["by_class"].items():
+    print(f"{name:<12}{row['expected']:>10}{row['counted']:>10}{row['error']:>+8}")
+  print(f"{'total':<12}{accuracy['expected_total']:>10}{accuracy['counted_total']:>10}")
+  print(f"absolute error {accuracy['abs_error']}, count accuracy {accuracy['accuracy']}")
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(description="Replay a recording through the detection pipeline and benchmark it")
+  parser.add_argument("source", help="Video file or directory of frames")
+  parser.add_argument("--fps", type=float, help="Frame rate of the recording (default: from the video, 30 for frames)")
+  parser.add_argument("--ground-truth", help="JSON file of expected per-class counts")
+  parser.add_argument("--model", default=MODEL_PATH, help="YOLO weights, or a model variant (fp32, int8)")
+  parser.add_argument("--backend", choices=DETECTOR_BACKENDS, default="ultralytics", help="Detector backend")
+  parser.add_argument("--speed", type=float, default=0.0,
+                      help="Feed rate as a multiple of the recording's frame rate (0: as fast as frames are read)")
+  parser.add_argument("--drop-frames", action="store_true",
+                      help="Drop frames between the stages like a live camera instead of replaying every frame")
+  parser.add_argument("--threads", type=int, help="Intra-op threads of the onnxruntime/openvino backends")
+  parser.add_argument("--batch-size", type=int, default=1)
+  parser.add_argument("--target-fps", type=float, default=10.0, help="Scheduler detection rate while tracking")
+  parser.add_argument("--detect-every-frame", action="store_true", help="Turn off scheduler frame skipping")
+  parser.add_argument("--no-motion-gating", action="store_true")
+  parser.add_argument("--zones", help="JSON file with a list of counting zones")
+  parser.add_argument("--roi", help="JSON file with a region of interest")
+  parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames (0: whole recording)")
+  parser.add_argument("--warmup", type=int, default=3, help="Untimed inferences before the run")
+  parser.add_argument("--event-sinks", nargs="+", help="Also write events to these sinks (firebase is the live database)")
+  parser.add_argument("--quiet", action="store_true", help="Hide the pipeline's per-vehicle log lines")
+  parser.add_argument("--json", help="Also write the full report to this file")
+  return parser
+
+
+def main():
+  args = build_parser().parse_args()
+
+  report = run(args)
+  print_report(report)
+  if args.json:
+    with open(args.json, "w", encoding="utf-8") as f:
+      json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+  main()
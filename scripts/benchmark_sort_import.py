@@ -0,0 +1,76 @@
+"""
+  Measures how long it takes to import the SORT tracker core compared to the SORT demo module,
+  which still loads matplotlib (TkAgg), pyplot and skimage the way sort.py used to.
+
+  Every import runs in a fresh interpreter so nothing is cached between runs. Reports the median
+  import time, the peak memory of the interpreter and which heavy modules got loaded.
+
+  Run from the project root:
+    python scripts/benchmark_sort_import.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+MODULES = {
+  "tracker core": "src.traffic_ai.vehicle_detection.sort",
+  "demo (old sort.py imports)": "src.traffic_ai.vehicle_detection.sort_demo",
+}
+
+HEAVY_MODULES = ("matplotlib", "matplotlib.pyplot", "tkinter", "skimage", "scipy", "lapx")
+
+# Runs inside the child interpreter, prints one JSON line
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+  "seconds": elapsed,
+  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+  "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module):
+  """Import `module` in a fresh interpreter, returns the probe result or the error output"""
+  code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+  proc = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+  if proc.returncode != 0:
+    return None, proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"
+  return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the import cost of the SORT tracker")
+  parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+  args = parser.parse_args()
+
+  for label, module in MODULES.items():
+    results = []
+    error = None
+    for _ in range(args.runs):
+      result, error = measure(module)
+      if result is None:
+        break
+      results.append(result)
+
+    if not results:
+      print(f"{label:<28} {module}: could not import ({error})")
+      continue
+
+    seconds = statistics.median(r["seconds"] for r in results)
+    rss = statistics.median(r["max_rss_mb"] for r in results)
+    loaded = ", ".join(results[-1]["loaded"]) or "none"
+    print(f"{label:<28} {seconds * 1000:8.1f} ms  {rss:7.1f} MB peak RSS  heavy modules: {loaded}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,281 @@
+"""
+  Static INT8 quantization of the YOLO ONNX model, calibrated on frames from our own cameras.
+
+  1. capture   grabs frames from a camera (or a recording) into a calibration directory, resized
+               to the pipeline's 480x270 so the calibration sees what the detector sees live
+  2. quantize  calibrates activation ranges on those frames with the same letterbox preprocessing
+               as the onnxruntime backend and writes a QDQ model (INT8 weights per channel, UINT8
+               activations). The decode part of the detection head (DFL, box math, class sigmoid)
+               stays FP32, its convolutions are still quantized
+  3. report    replays clips losslessly and unpaced through the pipeline with the FP32 and INT8
+               models and compares the detector's per-batch latency and throughput and the
+               per-class counting accuracy (ground truth: a JSON file next to each clip with the
+               same name, see benchmark_pipeline.py)
+
+  The pipeline loads the result with DETECTOR_MODEL=int8 in .env, or detector_model="int8" when
+  starting a camera.
+
+  Run from the project root:
+    python scripts/quantize_detector.py capture http://<pi-address>/stream --count 300 --interval 2
+    python scripts/quantize_detector.py quantize --calibration data/calibration
+    python scripts/quantize_detector.py report recordings/c4-road-day.mp4 recordings/c4-road-night.mp4
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import cv2
+import onnx
+from onnxruntime.quantization import (
+  CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.traffic_ai.vehicle_detection.detector import INT8_MODEL_PATH, MODEL_PATH, OnnxRuntimeDetector
+from src.traffic_ai.vehicle_detection.roi import FRAME_SIZE
+
+CALIBRATION_DIR = "data/calibration"
+CALIBRATION_METHODS = {
+  "minmax": CalibrationMethod.MinMax,
+  "percentile": CalibrationMethod.Percentile,
+  "entropy": CalibrationMethod.Entropy,
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+  """Feeds calibration frames to the quantizer, preprocessed exactly like OnnxRuntimeDetector does"""
+
+  def __init__(self, paths, detector):
+    self.paths = paths
+    self.detector = detector
+    self.position = 0
+
+  def get_next(self):
+    while self.position < len(self.paths):
+      frame = cv2.imread(self.paths[self.position])
+      self.position += 1
+      if frame is None:
+        continue
+      blob, _ = self.detector.preprocess([cv2.resize(frame, FRAME_SIZE)] * (self.detector.max_batch or 1))
+      return {self.detector.input_name: blob}
+    return None
+
+  def rewind(self):
+    self.position = 0
+
+
+def capture(source, out_dir, count, interval):
+  """Save `count` frames of a camera, one every `interval` seconds, as 480x270 JPEGs"""
+  os.makedirs(out_dir, exist_ok=True)
+  cap = cv2.VideoCapture(source)
+  if not cap.isOpened():
+    raise SystemExit(f"Cannot open camera: {source}")
+
+  saved, last = 0, None
+  try:
+    while saved < count:
+      ret, frame = cap.read()
+      if not ret:
+        break
+      now = time.monotonic()
+      if last is not None and now - last < interval:
+        continue
+      last = now
+      path = os.path.join(out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{saved:05d}.jpg")
+      cv2.imwrite(path, cv2.resize(frame, FRAME_SIZE))
+      saved += 1
+  finally:
+    cap.release()
+  print(f"Saved {saved} calibration frames to {out_dir}")
+
+
+def head_nodes(model_path):
+  """
+  Non-convolution nodes of the YOLO detection head (DFL, box decoding, sigmoid, concat), kept
+  in FP32 because quantizing them costs box accuracy for next to no speed
+  """
+  graph = onnx.load(model_path).graph
+  producers = {output: node for node in graph.node for output in node.output}
+  head = producers.get(graph.output[0].name)
+  # ultralytics exports name nodes after their module, e.g. /model.23/Concat_5
+  if head is None or not head.name.startswith("/model.") or head.name.count("/") < 2:
+    return []
+  prefix = head.name[:head.name.index("/", 1) + 1]
+  return [node.name for node in graph.node if node.name.startswith(prefix) and node.op_type != "Conv"]
+
+
+def quantize(args):
+  paths = sorted(
+    os.path.join(args.calibration, name) for name in os.listdir(args.calibration)
+    if name.lower().endswith(IMAGE_EXTENSIONS)
+  )[:args.max_frames or None]
+  if not paths:
+    raise SystemExit(f"No calibration frames in {args.calibration}, run the capture step first")
+
+  detector = OnnxRuntimeDetector(args.model)
+  exclude = head_nodes(args.model) if not args.quantize_head else []
+  print(f"Calibrating {args.model} on {len(paths)} frames ({args.method}), {len(exclude)} head nodes kept in FP32")
+
+  with tempfile.TemporaryDirectory() as tmp:
+    # ONNX shape inference and graph cleanup the quantizer expects, the export's shapes are
+    # static so the symbolic pass (and its sympy dependency) is not needed
+    prepared = os.path.join(tmp, "prepared.onnx")
+    quant_pre_process(args.model, prepared, skip_symbolic_shape=True)
+
+    started = time.perf_counter()
+    quantize_static(
+      prepared, args.output, FrameCalibrationReader(paths, detector),
+      quant_format=QuantFormat.QDQ,
+      activation_type=QuantType.QUInt8,
+      weight_type=QuantType.QInt8,
+      per_channel=True,
+      # CPUs without VNNI can saturate in the 8-bit multiply, 7-bit weights avoid it
+      reduce_range=args.reduce_range,
+      calibrate_method=CALIBRATION_METHODS[args.method],
+      nodes_to_exclude=exclude,
+    )
+
+  fp32_mb = os.path.getsize(args.model) / 2 ** 20
+  int8_mb = os.path.getsize(args.output) / 2 ** 20
+  print(f"Wrote {args.output} in {time.perf_counter() - started:.1f} s ({fp32_mb:.1f} MB -> {int8_mb:.1f} MB)")
+
+
+def replay(clip, model, args):
+  """
+  benchmark_pipeline report of one clip with one model. Lossless, unpaced and with every frame
+  detected, so both models see every frame of the clip however fast they are
+  """
+  # Imported here so capture and quantize do not need the pipeline's dependencies
+  from scripts.benchmark_pipeline import build_parser, run
+
+  argv = [clip, "--model", model, "--backend", args.backend, "--quiet", "--speed", "0",
+          "--detect-every-frame", "--no-motion-gating"]
+  ground_truth = os.path.splitext(clip)[0] + ".json"
+  if os.path.exists(ground_truth):
+    argv += ["--ground-truth", ground_truth]
+  return run(build_parser().parse_args(argv))
+
+
+def summarize(name, report):
+  # "inference" is timed once per detector call (a batch), the pipeline's fps depends on the other stages too
+  inference = report["stages"].get("inference", {})
+  accuracy = report.get("accuracy") or {}
+  frames = report["counters"].get("frames_detected", 0)
+  busy = inference.get("sum_ms", 0) / 1000
+  return {
+    "model": name,
+    "frames_detected": frames,
+    "dropped": report["drops"]["capture_queue_dropped"] + report["drops"]["result_queue_dropped"],
+    "inference_fps": round(frames / busy, 2) if busy else None,
+    "inference_mean_ms": inference.get("mean_ms"),
+    "inference_p95_ms": inference.get("p95_ms"),
+    "counts": report["counts"],
+    "count_accuracy": accuracy.get("accuracy"),
+    "abs_error": accuracy.get("abs_error"),
+  }
+
+
+def report(args):
+  clips = []
+  for clip in args.clips:
+    fp32 = summarize("fp32", replay(clip, args.fp32, args))
+    int8 = summarize("int8", replay(clip, args.int8, args))
+    speedup = fp32["inference_mean_ms"] / int8["inference_mean_ms"] if int8["inference_mean_ms"] else None
+    drop = None
+    if fp32["count_accuracy"] is not None and int8["count_accuracy"] is not None:
+      drop = round(fp32["count_accuracy"] - int8["count_accuracy"], 4)
+    clips.append({"clip": clip, "fp32": fp32, "int8": int8,
+                  "inference_speedup": round(speedup, 2) if speedup else None, "accuracy_drop": drop})
+
+  speedups = [c["inference_speedup"] for c in clips if c["inference_speedup"]]
+  drops = [c["accuracy_drop"] for c in clips if c["accuracy_drop"] is not None]
+  summary = {
+    "backend": args.backend,
+    "min_inference_speedup": min(speedups) if speedups else None,
+    "max_accuracy_drop": max(drops) if drops else None,
+  }
+  summary["accepted"] = bool(
+    speedups and summary["min_inference_speedup"] >= args.min_speedup
+    and (not drops or summary["max_accuracy_drop"] <= args.max_accuracy_drop)
+  )
+
+  lines = [
+    f"# FP32 vs INT8 detector ({args.backend})",
+    "",
+    f"FP32: `{args.fp32}`, INT8: `{args.int8}`, lossless replay with every frame detected. Latency is per "
+    f"detector call, inference fps is frames detected per second spent in the detector.",
+    "",
+    "| clip | model | frames detected | dropped | inference fps | inference mean ms | inference p95 ms "
+    "| count accuracy | abs error |",
+    "|---|---|---|---|---|---|---|---|---|",
+  ]
+  for c in clips:
+    for row in (c["fp32"], c["int8"]):
+      lines.append(f"| {os.path.basename(c['clip'])} | {row['model']} | {row['frames_detected']} | {row['dropped']} "
+                   f"| {row['inference_fps']} | {row['inference_mean_ms']} | {row['inference_p95_ms']} "
+                   f"| {row['count_accuracy']} | {row['abs_error']} |")
+  lines += [""]
+  for c in clips:
+    lines.append(f"- {os.path.basename(c['clip'])}: {c['inference_speedup']}x inference speedup, "
+                 f"accuracy drop {c['accuracy_drop']}, counts FP32 {c['fp32']['counts']} vs INT8 {c['int8']['counts']}")
+  lines += [
+    "",
+    f"Target: >= {args.min_speedup}x inference speedup with an accuracy drop <= {args.max_accuracy_drop}. "
+    f"Result: {summary['min_inference_speedup']}x, drop {summary['max_accuracy_drop']}, "
+    f"**{'accepted' if summary['accepted'] else 'not accepted'}**.",
+  ]
+  markdown = "\n".join(lines) + "\n"
+  print("\n" + markdown)
+
+  if args.out:
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+      f.write(markdown)
+    with open(os.path.splitext(args.out)[0] + ".json", "w", encoding="utf-8") as f:
+      json.dump({"summary": summary, "clips": clips}, f, indent=2)
+    print(f"Report written to {args.out}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="INT8 quantization of the YOLO detector")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  capture_parser = commands.add_parser("capture", help="Save calibration frames from a camera or recording")
+  capture_parser.add_argument("source", help="Camera URL/index or video file")
+  capture_parser.add_argument("--out", default=CALIBRATION_DIR)
+  capture_parser.add_argument("--count", type=int, default=300)
+  capture_parser.add_argument("--interval", type=float, default=2.0, help="Seconds between saved frames")
+
+  quantize_parser = commands.add_parser("quantize", help="Calibrate and write the INT8 model")
+  quantize_parser.add_argument("--model", default=MODEL_PATH, help="FP32 ONNX model")
+  quantize_parser.add_argument("--output", default=INT8_MODEL_PATH)
+  quantize_parser.add_argument("--calibration", default=CALIBRATION_DIR, help="Directory of calibration frames")
+  quantize_parser.add_argument("--max-frames", type=int, default=0, help="Use at most this many frames (0: all)")
+  quantize_parser.add_argument("--method", choices=CALIBRATION_METHODS, default="minmax")
+  quantize_parser.add_argument("--reduce-range", action="store_true", help="7-bit weights for CPUs without VNNI")
+  quantize_parser.add_argument("--quantize-head", action="store_true", help="Also quantize the head's decode nodes")
+
+  report_parser = commands.add_parser("report", help="Compare FP32 and INT8 on replay clips")
+  report_parser.add_argument("clips", nargs="+", help="Video files or frame directories")
+  report_parser.add_argument("--fp32", default=MODEL_PATH)
+  report_parser.add_argument("--int8", default=INT8_MODEL_PATH)
+  report_parser.add_argument("--backend", default="onnxruntime", choices=("ultralytics", "onnxruntime", "openvino"))
+  report_parser.add_argument("--min-speedup", type=float, default=2.0)
+  report_parser.add_argument("--max-accuracy-drop", type=float, default=0.02)
+  report_parser.add_argument("--out", help="Markdown report path, a JSON copy is written next to it")
+
+  args = parser.parse_args()
+  if args.command == "capture":
+    capture(args.source, args.out, args.count, args.interval)
+  elif args.command == "quantize":
+    quantize(args)
+  else:
+    report(args)
+
+
+if __name__ == "__main__":
+  main()
@@ -17,6 +17,7 @@ PUBLIC_ROUTES = {
   "/api/dashboard/livestream/video-feed",
   "/api/dashboard/livestream/detection-data",
   "/api/dashboard/livestream/stats",
+  "/api/dashboard/livestream/metrics",
   "/api/dashboard/livestream/switch-detection-mode",
 }
 
@@ -33,6 +33,16 @@ class Settings(BaseSettings):
   PI_MOBILE_HOTSPOT: str
   PI_LIVESTREAM_ADDRESS_LIST: List[str] = ["PI_HOME_WIFI", "PI_MOBILE_HOTSPOT"]
 
+  # detector settings, "fp32", "int8" (scripts/quantize_detector.py) or a model file path
+  DETECTOR_MODEL: str = "fp32"
+  # intra-op threads of the onnxruntime/openvino backends, 0 for the runtime's default (one per core)
+  DETECTOR_THREADS: int = 0
+
+  # where vehicle crossings/exits are written, JSON list in .env: "firebase", "mysql" (the db above),
+  # any SQLAlchemy URL (e.g. "sqlite:///cache/vehicle_events.db" offline) or "parquet://<directory>".
+  # scripts/aggregate_vehicle_data.py reads the forecasting input from "mysql"
+  EVENT_SINKS: List[str] = ["firebase", "mysql"]
+
   class Config:
     env_file = ".env"
     case_sensitive = True
@@ -44,6 +54,14 @@ class Settings(BaseSettings):
       f"@{self.MYSQL_HOST}/{self.MYSQL_DATABASE}"
     )
     return self.SQLALCHEMY_DATABASE_URI
+
+  def event_sink_urls(self):
+    # the detection pipeline writes from its own threads, so "mysql" gets a sync driver
+    mysql_uri = (
+      f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD.get_secret_value()}"
+      f"@{self.MYSQL_HOST}/{self.MYSQL_DATABASE}"
+    )
+    return [mysql_uri if sink == "mysql" else sink for sink in self.EVENT_SINKS]
   
 
   def get_pi_addresses(self) -> List[str]:
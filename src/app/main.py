@@ -33,7 +33,7 @@ from src.app.routes.dashboard_history_router import dashboard_history_router
 from src.app.core.cors_config import cors_middleware
 
 # vehicle detection
-from src.traffic_ai.vehicle_detection.vehicle_counter import start_optimized_detection
+from src.traffic_ai.vehicle_detection.pipeline_manager import pipeline_manager
 from src.traffic_ai.vehicle_detection.shared import detection_state
 
 # AI recommendation imports
@@ -142,7 +142,7 @@ async def life_span(app: FastAPI):
         # Initialize shared state (backup for compatibility)
         with detection_state.frame_lock:
             detection_state.latest_frame = np.zeros((270, 480, 3), dtype=np.uint8)
-            detection_state.latest_detections.clear()
+            detection_state.latest_detections = []  # Pipelines share their lists by reference, never clear in place
         print("Shared state initialized")
         
         # Get database session for initialization
@@ -156,11 +156,9 @@ async def life_span(app: FastAPI):
         
     finally:
         # Cleanup any running detection
-        from src.traffic_ai.vehicle_detection.vehicle_counter import get_pipeline
-        pipeline = get_pipeline()
-        if pipeline:
-            pipeline.stop()
-            print("Detection pipeline stopped")
+        if pipeline_manager.camera_ids():
+            pipeline_manager.stop_all()
+            print("Detection pipelines stopped")
         
         await engine.dispose()
         print("Application shutdown complete")
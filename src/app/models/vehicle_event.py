@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Date, DateTime, Float, Integer, String
+
+from src.app.db.base import Base
+
+"""
+  Crossings and exits written in bulk by the detection pipeline's sql event sink,
+  read by scripts/aggregate_vehicle_data.py
+"""
+
+class VehicleEvent(Base):
+  __tablename__ = "vehicle_events"
+
+  id = Column(Integer, primary_key=True, autoincrement=True)
+  event = Column(String(16), nullable=False) # crossing or exit
+  day = Column(Date, nullable=False, index=True)
+  camera_id = Column(String(64), index=True)
+
+  vehicle_id = Column(Integer)
+  vehicle_class = Column(String(32))
+  confidence_score = Column(Float)
+  zone = Column(String(64))
+  direction = Column(String(16))
+  time_in = Column(String(8))
+  time_out = Column(String(8))
+  speed_ms = Column(Float)
+  detected_at = Column(DateTime, index=True)
@@ -1,20 +1,26 @@
 import logging
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from src.app.exceptions.custom_exceptions import *
 from src.app.services.dashboard_livestream_service import (
     generate_raw_stream, 
     generate_processed_stream, 
     get_current_detections,
+    get_current_frame_id,
     start_detection_pipeline,
     stop_detection_pipeline,
     switch_detection_mode,
     get_pipeline_status,
+    get_all_pipeline_status,
+    get_pipeline_metrics,
+    get_pipeline_metrics_prometheus,
     test_pi_connection,
     get_available_pi_addresses
 )
 from src.app.schemas.livestream_schema import *
+from src.traffic_ai.vehicle_detection.vehicle_counter import DEFAULT_CAMERA_ID
 
 
 dashboard_livestream_router = APIRouter(
@@ -23,6 +29,18 @@ dashboard_livestream_router = APIRouter(
   )
 
 
+def zone_configs(request: StartLivestreamRequest):
+  """Counting zones of a start request as plain dicts, None keeps the default line"""
+  if request.counting_zones is None:
+    return None
+  return [zone.model_dump() for zone in request.counting_zones]
+
+
+def roi_config(request: StartLivestreamRequest):
+  """ROI of a start request as a plain dict, None keeps full frame inference"""
+  return request.roi.model_dump() if request.roi is not None else None
+
+
 # # === LIVESTREAM CONTROL ENDPOINTS ===
 
 # === LIVESTREAM CONTROL ENDPOINTS ===
@@ -58,7 +76,12 @@ async def start_livestream(request: StartLivestreamRequest):
       camera_source = request.camera_source
     
     # Start the detection pipeline
-    success, message = start_detection_pipeline(camera_source, "raw")
+    success, message = start_detection_pipeline(
+      camera_source, "raw", request.batch_size, execution_mode=request.execution_mode,
+      counting_zones=zone_configs(request), roi=roi_config(request), target_fps=request.target_fps,
+      motion_gating=request.motion_gating, detector_backend=request.detector_backend,
+      detector_model=request.detector_model
+    )
     
     return LivestreamResponse(
       success=success,
@@ -117,6 +140,73 @@ async def get_livestream_status():
     }
 
 
+# === PER-CAMERA CONTROL ENDPOINTS ===
+
+@dashboard_livestream_router.get("/cameras")
+async def list_cameras():
+  """Get the status of every camera pipeline"""
+  try:
+    return {"cameras": get_all_pipeline_status()}
+  except Exception as e:
+    logging.error(f"Error listing camera pipelines: {e}")
+    return {"cameras": []}
+
+
+@dashboard_livestream_router.post("/cameras/{camera_id}/start", response_model=LivestreamResponse)
+async def start_camera(camera_id: str, request: StartLivestreamRequest):
+  """Start the detection pipeline of one camera, other cameras keep running"""
+  try:
+    if not request.camera_source:
+      return LivestreamResponse(
+        success=False,
+        message="camera_source is required when starting a specific camera"
+      )
+    
+    success, message = start_detection_pipeline(
+      request.camera_source, "processed", request.batch_size, camera_id, request.execution_mode,
+      zone_configs(request), roi_config(request), request.target_fps, request.motion_gating,
+      request.detector_backend, request.detector_model
+    )
+    
+    return LivestreamResponse(
+      success=success,
+      message=message,
+      camera_source=request.camera_source if success else None
+    )
+      
+  except Exception as e:
+    logging.error(f"Error starting camera {camera_id}: {e}")
+    return LivestreamResponse(
+      success=False,
+      message=f"Failed to start camera: {str(e)}"
+    )
+
+
+@dashboard_livestream_router.post("/cameras/{camera_id}/stop", response_model=LivestreamResponse)
+async def stop_camera(camera_id: str):
+  """Stop the detection pipeline of one camera"""
+  try:
+    success, message = stop_detection_pipeline(camera_id)
+    
+    return LivestreamResponse(
+      success=success,
+      message=message
+    )
+      
+  except Exception as e:
+    logging.error(f"Error stopping camera {camera_id}: {e}")
+    return LivestreamResponse(
+      success=False,
+      message=f"Failed to stop camera: {str(e)}"
+    )
+
+
+@dashboard_livestream_router.get("/cameras/{camera_id}/status")
+async def get_camera_status(camera_id: str):
+  """Get the pipeline status of one camera"""
+  return get_pipeline_status(camera_id)
+
+
 @dashboard_livestream_router.get("/test-pi-connection")
 async def test_pi_connection_endpoint(address_index: int = AddressIndex):
   """Test connection to a specific Pi address by index"""
@@ -142,16 +232,17 @@ async def test_pi_connection_endpoint(address_index: int = AddressIndex):
 # === VIDEO STREAMING ENDPOINTS ===
 
 @dashboard_livestream_router.get("/video-feed/raw")
-async def get_raw_video_feed():
+async def get_raw_video_feed(request: Request, camera_id: str = DEFAULT_CAMERA_ID,
+                             max_fps: Optional[float] = Query(default=None, gt=0, le=60)):
   """Stream raw video feed WITHOUT AI processing"""
   try:
-    logging.info("Raw video feed requested")
+    logging.info(f"Raw video feed requested for {camera_id}")
 
     # Automatically switch to raw mode (no Firebase updates)
-    switch_detection_mode("raw")
+    switch_detection_mode("raw", camera_id)
     
     return StreamingResponse(
-      generate_raw_stream(), 
+      generate_raw_stream(camera_id, request, max_fps), 
       media_type="multipart/x-mixed-replace; boundary=frame",
       headers={
         "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -166,16 +257,17 @@ async def get_raw_video_feed():
 
 
 @dashboard_livestream_router.get("/video-feed/processed")
-async def get_processed_video_feed():
+async def get_processed_video_feed(request: Request, camera_id: str = DEFAULT_CAMERA_ID,
+                                   max_fps: Optional[float] = Query(default=None, gt=0, le=60)):
   """Stream processed video feed WITH AI annotations"""
   try:
-    logging.info("Processed video feed requested")
+    logging.info(f"Processed video feed requested for {camera_id}")
 
     # Automatically switch to processed mode (Firebase updates enabled)
-    switch_detection_mode("processed")
+    switch_detection_mode("processed", camera_id)
     
     return StreamingResponse(
-      generate_processed_stream(), 
+      generate_processed_stream(camera_id, request, max_fps), 
       media_type="multipart/x-mixed-replace; boundary=frame",
       headers={
         "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -190,9 +282,9 @@ async def get_processed_video_feed():
 
 
 @dashboard_livestream_router.get("/video-feed")
-async def get_video_feed():
+async def get_video_feed(request: Request, camera_id: str = DEFAULT_CAMERA_ID):
   """Default video feed (raw for overlay compatibility)"""
-  return await get_raw_video_feed()
+  return await get_raw_video_feed(request, camera_id, None)
 
 
 @dashboard_livestream_router.post("/switch-detection-mode")
@@ -223,37 +315,39 @@ async def switch_mode(request: SwitchModeRequest):
 # === DETECTION DATA ENDPOINTS ===
 
 @dashboard_livestream_router.get("/detection-data")
-def get_detection_data():
+def get_detection_data(camera_id: str = DEFAULT_CAMERA_ID):
   """Get current detection data"""
   try:
-    detections = get_current_detections()
+    detections = get_current_detections(camera_id)
     
     logging.debug(f"Returning {len(detections)} detections")
     
-    return {"objects": detections}
+    return {"objects": detections, "frame_id": get_current_frame_id(camera_id)}
       
   except Exception as e:
     logging.error(f"Error in detection data endpoint: {e}")
-    return {"objects": []}
+    return {"objects": [], "frame_id": 0}
 
 
 @dashboard_livestream_router.get("/stats")
-def get_detection_stats():
+def get_detection_stats(camera_id: str = DEFAULT_CAMERA_ID):
   """Get detection statistics"""
   try:
-    from src.traffic_ai.vehicle_detection.vehicle_counter import get_pipeline
+    from src.traffic_ai.vehicle_detection.pipeline_manager import get_pipeline
     
-    pipeline = get_pipeline()
+    pipeline = get_pipeline(camera_id)
     if pipeline is None:
       return {
         "total_count": 0,
         "vehicle_counts": {},
+        "zones": [],
         "status": "stopped"
       }
     
     return {
       "total_count": pipeline.get_persistent_total_count(),
       "vehicle_counts": pipeline.vehicle_class_counts,
+      "zones": pipeline.zone_counter.snapshot(),
       "status": "running" if pipeline.running else "stopped"
     }
         
@@ -262,5 +356,25 @@ def get_detection_stats():
     return {
       "total_count": 0,
       "vehicle_counts": {},
+      "zones": [],
       "status": "error"
-    }
\ No newline at end of file
+    }
+
+
+@dashboard_livestream_router.get("/metrics")
+def get_metrics(camera_id: Optional[str] = None, format: Literal["json", "prometheus"] = "json"):
+  """Per-stage pipeline timings (p50/p95/p99), frame counters and queue depths, of every camera by default"""
+  try:
+    if format == "prometheus":
+      return PlainTextResponse(
+        get_pipeline_metrics_prometheus(camera_id),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+      )
+    
+    return {"cameras": get_pipeline_metrics(camera_id)}
+      
+  except Exception as e:
+    logging.error(f"Error in metrics endpoint: {e}")
+    if format == "prometheus":
+      return PlainTextResponse("", media_type="text/plain; version=0.0.4; charset=utf-8")
+    return {"cameras": {}}
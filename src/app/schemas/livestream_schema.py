@@ -1,10 +1,31 @@
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
+class CountingZoneConfig(BaseModel):
+  name: str
+  type: Literal["line", "polygon"] = "line"
+  points: List[Tuple[float, float]] = Field(min_length=2)  # 480x270 frame coordinates, 2 for a line, 3+ for a polygon
+  direction: Literal["inbound", "outbound", "both"] = "both"  # Line: right -> left of points[0] -> points[1], polygon: entering
+
+class RegionOfInterestConfig(BaseModel):
+  box: Optional[Tuple[int, int, int, int]] = None  # x1, y1, x2, y2 in 480x270 frame coordinates
+  polygon: Optional[List[Tuple[float, float]]] = None  # Road outline, pixels outside it are masked
+  native_tiles: bool = False  # Tile the ROI at the camera's full resolution for small, distant vehicles
+  tile_size: Tuple[int, int] = (480, 270)  # Native pixels (width, height), must fit 480x270 in "process" mode
+  tile_overlap: float = Field(default=0.2, ge=0, lt=0.9)
+
 class StartLivestreamRequest(BaseModel):
   camera_source: Optional[str] = None  # If not provided, will auto-detect
+  batch_size: int = Field(default=1, ge=1, le=16)  # Frames per YOLO call, needs a dynamic-batch ONNX export when > 1
+  execution_mode: Literal["thread", "process"] = "thread"  # "process" runs YOLO in worker processes off the API's GIL
+  counting_zones: Optional[List[CountingZoneConfig]] = None  # Defaults to the single counting line
+  roi: Optional[RegionOfInterestConfig] = None  # Defaults to running YOLO on the whole frame
+  target_fps: float = Field(default=10.0, gt=0, le=30)  # Detection rate away from the counting zones
+  motion_gating: bool = True  # Skip YOLO on motionless frames while no vehicle is tracked
+  detector_backend: Literal["ultralytics", "onnxruntime", "openvino"] = "ultralytics"  # Inference engine of this camera
+  detector_model: Optional[Literal["fp32", "int8"]] = None  # Defaults to the DETECTOR_MODEL setting
 
 class LivestreamResponse(BaseModel):
   success: bool
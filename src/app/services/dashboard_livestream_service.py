@@ -6,95 +6,130 @@ import threading
 import logging
 import asyncio
 import aiohttp
+from functools import lru_cache
 from typing import List, Tuple, Optional
+from fastapi import Request
 
-from src.traffic_ai.vehicle_detection.vehicle_counter import (
-    get_pipeline, 
-    start_optimized_detection,
-    set_detection_mode,
-    OptimizedDetectionPipeline
+from src.traffic_ai.vehicle_detection.vehicle_counter import DEFAULT_CAMERA_ID
+from src.traffic_ai.vehicle_detection.pipeline_manager import (
+    pipeline_manager,
+    get_pipeline,
+    set_detection_mode
 )
+from src.traffic_ai.vehicle_detection.metrics import prometheus_text
 from src.app.core.settings import settings
 
-# Global pipeline control
-_pipeline_thread: Optional[threading.Thread] = None
-_pipeline_stop_event = threading.Event()
 
-def generate_raw_stream():
-  """Generate raw video stream from the pipeline"""
-  while True:
-    pipeline = get_pipeline()
-    if pipeline is None or not pipeline.running:
-      # No pipeline running, send placeholder
-      placeholder = np.zeros((270, 480, 3), dtype=np.uint8)
-      cv2.putText(placeholder, "Livestream Stopped", (120, 120), 
-                  cv2.FONT_HERSHEY_SIMPLEX, 1, (128, 128, 128), 2)
-      cv2.putText(placeholder, "Click Start to begin", (110, 160), 
-                  cv2.FONT_HERSHEY_SIMPLEX, 0.8, (128, 128, 128), 2)
-      frame = placeholder
-    else:
-      # Get raw frame from pipeline
-      frame = pipeline.get_raw_frame()
-      if frame is None:
-        # Camera disconnected, send error frame
-        error_frame = np.zeros((270, 480, 3), dtype=np.uint8)
-        cv2.putText(error_frame, "Camera Error", (150, 135), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        frame = error_frame
+# Seconds between placeholder frames while the camera is stopped
+STOPPED_POLL_INTERVAL = 1.0
+# Seconds a viewer waits for a new frame before re-checking the pipeline and the connection
+FRAME_WAIT_TIMEOUT = 1.0
+
+# Status frames shown instead of the camera: (lines of (text, origin, scale), color)
+PLACEHOLDER_FRAMES = {
+  "raw_stopped": ([("Livestream Stopped", (120, 120), 1), ("Click Start to begin", (110, 160), 0.8)], (128, 128, 128)),
+  "processed_stopped": ([("AI Detection Stopped", (100, 120), 1), ("Start livestream first", (110, 160), 0.8)], (128, 128, 128)),
+  "raw_waiting": ([("Camera Error", (150, 135), 1)], (0, 0, 255)),
+  "processed_waiting": ([("Processing...", (150, 135), 1)], (255, 255, 0)),
+}
+
+
+@lru_cache(maxsize=None)
+def placeholder_jpeg(kind: str) -> bytes:
+  """Encode a status frame once, every viewer reuses the bytes"""
+  lines, color = PLACEHOLDER_FRAMES[kind]
+  placeholder = np.zeros((270, 480, 3), dtype=np.uint8)
+  for text, origin, scale in lines:
+    cv2.putText(placeholder, text, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, color, 2)
+  _, jpeg = cv2.imencode('.jpg', placeholder, [cv2.IMWRITE_JPEG_QUALITY, 85])
+  return jpeg.tobytes()
+
+
+def mjpeg_part(frame_bytes: bytes) -> bytes:
+  return (b'--frame\r\n'
+          b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+
+async def generate_stream(stream_type: str, camera_id: str = DEFAULT_CAMERA_ID, request: Optional[Request] = None,
+                          max_fps: Optional[float] = None):
+  """
+  Stream the camera's JPEG bytes from its broadcast hub, each new frame once.
+  `max_fps` caps this client's rate, frames published in between are skipped.
+  """
+  hub = pipeline_manager.get_hub(camera_id)
+  hub.subscribe(stream_type)
+  last_sequence = 0
+  min_interval = 1.0 / max_fps if max_fps else 0.0
+  last_sent = 0.0
+  try:
+    while True:
+      if request is not None and await request.is_disconnected():
+        logging.info(f"{stream_type} viewer of {camera_id} disconnected")
+        break
       
-    # Encode frame
-    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    frame_bytes = jpeg.tobytes()
-    
-    # Yield MJPEG frame
-    yield (b'--frame\r\n'
-            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-    
-    time.sleep(0.033)  # ~30fps
+      pipeline = get_pipeline(camera_id)
+      if pipeline is None or not pipeline.running:
+        # No pipeline running, send placeholder and check again later
+        yield mjpeg_part(placeholder_jpeg(f"{stream_type}_stopped"))
+        await asyncio.sleep(STOPPED_POLL_INTERVAL)
+        continue
+      
+      sequence, frame_bytes = await hub.next_frame(stream_type, last_sequence, timeout=FRAME_WAIT_TIMEOUT)
+      if frame_bytes is None:
+        # Camera disconnected or no frame encoded yet
+        yield mjpeg_part(placeholder_jpeg(f"{stream_type}_waiting"))
+        continue
+      
+      if sequence == last_sequence:
+        # Timed out without a new frame, loop to re-check the pipeline and the client
+        continue
+      
+      last_sequence = sequence
+      # Yield MJPEG frame
+      yield mjpeg_part(frame_bytes)
+      
+      if min_interval:
+        # Throttle this client only, the next wait returns the newest frame
+        now = time.monotonic()
+        delay = min_interval - (now - last_sent)
+        last_sent = now + max(0.0, delay)
+        if delay > 0:
+          await asyncio.sleep(delay)
+  finally:
+    # Runs on disconnect, also when Starlette cancels the stream
+    hub.unsubscribe(stream_type)
+
+
+def generate_raw_stream(camera_id: str = DEFAULT_CAMERA_ID, request: Optional[Request] = None,
+                        max_fps: Optional[float] = None):
+  """Generate raw video stream from the pipeline"""
+  return generate_stream("raw", camera_id, request, max_fps)
 
 
-def generate_processed_stream():
+def generate_processed_stream(camera_id: str = DEFAULT_CAMERA_ID, request: Optional[Request] = None,
+                              max_fps: Optional[float] = None):
   """Generate processed video stream with AI annotations"""
-  while True:
-    pipeline = get_pipeline()
-    if pipeline is None or not pipeline.running:
-      # No pipeline running, send placeholder
-      placeholder = np.zeros((270, 480, 3), dtype=np.uint8)
-      cv2.putText(placeholder, "AI Detection Stopped", (100, 120), 
-                  cv2.FONT_HERSHEY_SIMPLEX, 1, (128, 128, 128), 2)
-      cv2.putText(placeholder, "Start livestream first", (110, 160), 
-                  cv2.FONT_HERSHEY_SIMPLEX, 0.8, (128, 128, 128), 2)
-      frame = placeholder
-    else:
-      # Get processed frame from pipeline
-      frame = pipeline.get_processed_frame()
-      if frame is None:
-          # No processed frame yet
-          loading_frame = np.zeros((270, 480, 3), dtype=np.uint8)
-          cv2.putText(loading_frame, "Processing...", (150, 135), 
-                      cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-          frame = loading_frame
-    
-    # Encode frame
-    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    frame_bytes = jpeg.tobytes()
-    
-    # Yield MJPEG frame
-    yield (b'--frame\r\n'
-            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-    
-    time.sleep(0.033)  # ~30fps
+  return generate_stream("processed", camera_id, request, max_fps)
 
 
-def get_current_detections():
+def get_current_detections(camera_id: str = DEFAULT_CAMERA_ID):
   """Get current detections from the pipeline"""
-  pipeline = get_pipeline()
+  pipeline = get_pipeline(camera_id)
   if pipeline is None or not pipeline.running:
     return []
   
   return pipeline.get_detections()
 
 
+def get_current_frame_id(camera_id: str = DEFAULT_CAMERA_ID) -> int:
+  """Frame ID the current detections belong to"""
+  pipeline = get_pipeline(camera_id)
+  if pipeline is None or not pipeline.running:
+    return 0
+  
+  return pipeline.get_frame_id("processed")
+
+
 def get_available_pi_addresses() -> List[str]:
   """Get list of available Pi addresses from settings"""
   return settings.get_pi_addresses()
@@ -116,39 +151,34 @@ async def test_pi_connection(address: str, timeout: int = 5) -> bool:
     return False
 
 
-def start_detection_pipeline(camera_source: str, detection_mode: str = "raw") -> Tuple[bool, str]:  # ADD detection_mode parameter
-  """Start the detection pipeline with specified camera source and mode"""
-  global _pipeline_thread, _pipeline_stop_event
-  
+def start_detection_pipeline(camera_source: str, detection_mode: str = "raw", batch_size: int = 1,
+                             camera_id: str = DEFAULT_CAMERA_ID, execution_mode: str = "thread",
+                             counting_zones: Optional[List[dict]] = None,
+                             roi: Optional[dict] = None, target_fps: float = 10.0,
+                             motion_gating: bool = True,
+                             detector_backend: str = "ultralytics",
+                             detector_model: Optional[str] = None) -> Tuple[bool, str]:
+  """Start the detection pipeline of a camera with specified camera source and mode"""
   try:
     # Check if pipeline is already running
-    pipeline = get_pipeline()
+    pipeline = get_pipeline(camera_id)
     if pipeline and pipeline.running:
       return False, "Pipeline is already running. Stop it first."
     
-    # Stop any existing thread
-    if _pipeline_thread and _pipeline_thread.is_alive():
-      _pipeline_stop_event.set()
-      _pipeline_thread.join(timeout=5)
-    
-    # Reset stop event
-    _pipeline_stop_event.clear()
-    
     # Start new detection thread WITH detection mode
-    _pipeline_thread = threading.Thread(
-      target=start_optimized_detection,
-      args=(camera_source, detection_mode),  # PASS detection_mode
-      daemon=True
-    )
-    _pipeline_thread.start()
+    pipeline_manager.start(camera_id, camera_source, detection_mode, batch_size, execution_mode, counting_zones, roi,
+                           target_fps, motion_gating, detector_backend, detector_model or settings.DETECTOR_MODEL,
+                           settings.event_sink_urls(), settings.DETECTOR_THREADS or None)
     
     # Give the pipeline time to initialize
     time.sleep(2)
     
     # Verify pipeline started
-    pipeline = get_pipeline()
+    pipeline = get_pipeline(camera_id)
     if pipeline and pipeline.running:
-      logging.info(f"Detection pipeline started with source: {camera_source}, mode: {detection_mode}")
+      logging.info(f"Detection pipeline {camera_id} started with source: {camera_source}, mode: {detection_mode}, "
+                   f"batch size: {batch_size}, execution: {execution_mode}, "
+                   f"detector: {detector_backend} ({detector_model or settings.DETECTOR_MODEL}), sinks: {settings.EVENT_SINKS}")
       return True, f"Livestream started successfully (mode: {detection_mode})"
     else:
       return False, "Failed to initialize detection pipeline"
@@ -158,18 +188,15 @@ def start_detection_pipeline(camera_source: str, detection_mode: str = "raw") ->
     return False, f"Failed to start pipeline: {str(e)}"
 
 
-def switch_detection_mode(mode: str) -> Tuple[bool, str]:
+def switch_detection_mode(mode: str, camera_id: str = DEFAULT_CAMERA_ID) -> Tuple[bool, str]:
   """Switch detection mode without restarting pipeline"""
   try:
-    # Import from correct module
-    from src.traffic_ai.vehicle_detection.vehicle_counter import set_detection_mode
-    
-    pipeline = get_pipeline()
+    pipeline = get_pipeline(camera_id)
     if pipeline is None:
       return False, "No pipeline is currently running"
     
-    if set_detection_mode(mode):
-      logging.info(f"Detection mode switched to: {mode}")
+    if set_detection_mode(mode, camera_id):
+      logging.info(f"Detection mode of {camera_id} switched to: {mode}")
       return True, f"Detection mode switched to: {mode}"
     else:
       return False, "Invalid detection mode"
@@ -179,31 +206,14 @@ def switch_detection_mode(mode: str) -> Tuple[bool, str]:
     return False, f"Failed to switch mode: {str(e)}"
 
 
-def stop_detection_pipeline() -> Tuple[bool, str]:
-  """Stop the detection pipeline"""
-  global _pipeline_thread, _pipeline_stop_event
-  
+def stop_detection_pipeline(camera_id: str = DEFAULT_CAMERA_ID) -> Tuple[bool, str]:
+  """Stop the detection pipeline of a camera"""
   try:
-    # Get current pipeline
-    pipeline = get_pipeline()
-    
-    if pipeline is None:
+    # Stop the pipeline and wait for its thread to finish
+    if not pipeline_manager.stop(camera_id):
       return False, "No pipeline is currently running"
     
-    # Stop the pipeline
-    pipeline.stop()
-    
-    # Signal thread to stop
-    _pipeline_stop_event.set()
-    
-    # Wait for thread to finish
-    if _pipeline_thread and _pipeline_thread.is_alive():
-      _pipeline_thread.join(timeout=10)
-    
-    # Reset thread reference
-    _pipeline_thread = None
-    
-    logging.info("Detection pipeline stopped successfully")
+    logging.info(f"Detection pipeline {camera_id} stopped successfully")
     return True, "Livestream stopped successfully"
       
   except Exception as e:
@@ -211,27 +221,29 @@ def stop_detection_pipeline() -> Tuple[bool, str]:
     return False, f"Failed to stop pipeline: {str(e)}"
 
 
-def get_pipeline_status() -> dict:
-  """Get current pipeline status"""
+def get_pipeline_status(camera_id: str = DEFAULT_CAMERA_ID) -> dict:
+  """Get current pipeline status of a camera"""
   try:
-    pipeline = get_pipeline()
-    
-    if pipeline is None:
-      return {
-        "running": False,
-        "message": "Pipeline not initialized"
-      }
-    
-    return {
-      "running": pipeline.running,
-      "camera_source": getattr(pipeline, 'camera_source', None),
-      "detection_mode": getattr(pipeline, 'detection_mode', 'unknown'),  # ADD THIS LINE
-      "message": "Pipeline running" if pipeline.running else "Pipeline stopped"
-    }
+    return pipeline_manager.status(camera_id)
       
   except Exception as e:
     logging.error(f"Error getting pipeline status: {e}")
     return {
       "running": False,
       "message": f"Error: {str(e)}"
-    }
\ No newline at end of file
+    }
+
+
+def get_all_pipeline_status() -> List[dict]:
+  """Get the status of every camera pipeline"""
+  return pipeline_manager.all_status()
+
+
+def get_pipeline_metrics(camera_id: Optional[str] = None) -> dict:
+  """Per-stage timings, counters and queue depths of one or every camera pipeline"""
+  return pipeline_manager.metrics(camera_id)
+
+
+def get_pipeline_metrics_prometheus(camera_id: Optional[str] = None) -> str:
+  """Pipeline metrics in the Prometheus text exposition format"""
+  return prometheus_text(pipeline_manager.metrics(camera_id))
@@ -0,0 +1,205 @@
+import threading
+import cv2
+import numpy as np
+
+ZONE_TYPES = ("line", "polygon")
+ZONE_DIRECTIONS = ("inbound", "outbound", "both")
+
+# The old hard-coded counting line, adjusted for 480x270 resolution
+DEFAULT_COUNTING_ZONES = [
+    {"name": "main", "type": "line", "points": [[400, 135], [80, 135]], "direction": "both"}
+]
+
+
+def side_of(a, b, points):
+    """Cross product sign test of `points` (N,2) against the directed line a -> b, > 0 is right of it on screen"""
+    return (b[0] - a[0]) * (points[:, 1] - a[1]) - (b[1] - a[1]) * (points[:, 0] - a[0])
+
+
+def distance_to_segments(starts, ends, points):
+    """Distance of every point (N,2) to the nearest of the segments starts[i] -> ends[i] (S,2), returns (N,)"""
+    d = ends - starts
+    length_sq = np.maximum((d ** 2).sum(axis=1), 1e-9)
+    rel = points[:, None, :] - starts[None, :, :]
+    t = np.clip((rel * d[None]).sum(axis=2) / length_sq, 0.0, 1.0)
+    closest = starts[None] + t[:, :, None] * d[None]
+    return np.sqrt(((points[:, None, :] - closest) ** 2).sum(axis=2)).min(axis=1)
+
+
+def points_in_polygon(polygon, points):
+    """Even-odd rule for many points at once, returns an (N,) bool array"""
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    spans = (y1 > y) != (y2 > y)
+    # Where the edge is horizontal `spans` is False, the division result is never used
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return (np.count_nonzero(spans & (x < x_cross), axis=1) % 2) == 1
+
+
+class CountingZone:
+    """
+    A counting line or polygon of one camera, crossings are tested on the move between two centroids.
+    "inbound" crosses a line from its right to its left side (points[0] -> points[-1] on screen) or enters a polygon
+    """
+
+    def __init__(self, name, points, kind="line", direction="both"):
+        if kind not in ZONE_TYPES:
+            raise ValueError(f"Unknown zone type '{kind}', use one of {ZONE_TYPES}")
+        if direction not in ZONE_DIRECTIONS:
+            raise ValueError(f"Unknown zone direction '{direction}', use one of {ZONE_DIRECTIONS}")
+
+        self.name = name
+        self.kind = kind
+        self.direction = direction
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if kind == "line" and len(self.points) != 2:
+            raise ValueError(f"Line zone '{name}' needs exactly 2 points")
+        if kind == "polygon" and len(self.points) < 3:
+            raise ValueError(f"Polygon zone '{name}' needs at least 3 points")
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a zone from a {"name", "type", "points", "direction"} dict"""
+        return cls(config["name"], config["points"], config.get("type", "line"), config.get("direction", "both"))
+
+    def to_config(self):
+        return {"name": self.name, "type": self.kind, "points": self.points.tolist(), "direction": self.direction}
+
+    def crossings(self, previous, current):
+        """
+        Test every track's move previous -> current ((N,2) centroid arrays) against the zone.
+        Returns an (N,) int8 array: 1 inbound, -1 outbound, 0 no crossing.
+        """
+        if self.kind == "line":
+            a, b = self.points
+            # The move has to go from one strict side of the line to the other side (or onto it),
+            # so a centroid resting on the line is not counted again on the next frame
+            before, after = side_of(a, b, previous), side_of(a, b, current)
+            # ... and the line's end points must lie on opposite sides of the move
+            straddles = side_of(previous.T, current.T, a[None]) * side_of(previous.T, current.T, b[None]) <= 0
+            inbound = straddles & (before > 0) & (after <= 0)
+            outbound = straddles & (before < 0) & (after >= 0)
+        else:
+            was_inside = points_in_polygon(self.points, previous)
+            is_inside = points_in_polygon(self.points, current)
+            inbound = ~was_inside & is_inside
+            outbound = was_inside & ~is_inside
+
+        if self.direction == "inbound":
+            outbound = np.zeros_like(outbound)
+        elif self.direction == "outbound":
+            inbound = np.zeros_like(inbound)
+        return inbound.astype(np.int8) - outbound.astype(np.int8)
+
+    def distances(self, points):
+        """Pixel distance of every point (N,2) to the zone, 0 inside a polygon"""
+        if self.kind == "line":
+            return distance_to_segments(self.points[:1], self.points[1:], points)
+        distance = distance_to_segments(self.points, np.roll(self.points, -1, axis=0), points)
+        distance[points_in_polygon(self.points, points)] = 0.0
+        return distance
+
+    def draw(self, frame, color=(0, 0, 255)):
+        pts = self.points.astype(np.int32)
+        cv2.polylines(frame, [pts], self.kind == "polygon", color, 3 if self.kind == "line" else 2)
+        cv2.putText(frame, self.name, (int(pts[0][0]), max(12, int(pts[0][1]) - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1)
+
+
+class ZoneCounter:
+    """Per-zone, per-direction vehicle counts of one camera, each track is counted at most once per zone"""
+
+    def __init__(self, zones, max_gap=30):
+        self.zones = list(zones)
+        names = [zone.name for zone in self.zones]
+        if len(set(names)) != len(names):
+            raise ValueError("Counting zone names must be unique")
+        self.max_gap = max_gap
+        self.frame = 0
+        self.previous = {}  # track ID -> (x, y, frame last seen)
+        self.counted = {zone.name: set() for zone in self.zones}
+        self.counts = {}
+        self.lock = threading.Lock()  # /stats reads the counts from the API thread
+        self.reset_counts()
+
+    @classmethod
+    def from_config(cls, configs=None):
+        configs = DEFAULT_COUNTING_ZONES if configs is None else configs
+        return cls([CountingZone.from_config(config) for config in configs])
+
+    def reset_counts(self):
+        """Zero every zone's counts, e.g. at midnight"""
+        with self.lock:
+            self.counts = {zone.name: {"inbound": 0, "outbound": 0, "by_class": {}} for zone in self.zones}
+            for counted in self.counted.values():
+                counted.clear()
+
+    def update(self, track_ids, centroids, labels):
+        """
+        Feed one frame's tracks (IDs, (N,2) centroids, class labels) and count new crossings.
+        Returns a list of (row, zone name, "inbound"/"outbound") for every new count.
+        """
+        self.frame += 1
+        track_ids = np.asarray(track_ids).tolist()
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+
+        events = []
+        known = [i for i, track_id in enumerate(track_ids) if track_id in self.previous]
+        if known and self.zones:
+            rows = np.array(known)
+            previous = np.array([self.previous[track_ids[i]][:2] for i in known], dtype=np.float64)
+            current = centroids[rows]
+            for zone in self.zones:
+                crossed = zone.crossings(previous, current)
+                counted = self.counted[zone.name]
+                for row, sign in zip(rows[crossed != 0].tolist(), crossed[crossed != 0].tolist()):
+                    track_id = track_ids[row]
+                    if track_id in counted:
+                        continue
+                    counted.add(track_id)
+                    direction = "inbound" if sign > 0 else "outbound"
+                    label = labels[row] or "car"
+                    with self.lock:
+                        zone_counts = self.counts[zone.name]
+                        zone_counts[direction] += 1
+                        zone_counts["by_class"][label] = zone_counts["by_class"].get(label, 0) + 1
+                    events.append((row, zone.name, direction))
+
+        for track_id, (x, y) in zip(track_ids, centroids.tolist()):
+            self.previous[track_id] = (x, y, self.frame)
+        # Forget tracks SORT has given up on
+        stale = [track_id for track_id, (_, _, seen) in self.previous.items() if self.frame - seen > self.max_gap]
+        for track_id in stale:
+            del self.previous[track_id]
+            for counted in self.counted.values():
+                counted.discard(track_id)
+        return events
+
+    def distances(self, points):
+        """Distance of every point (N,2) to its nearest zone, inf without zones"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not self.zones:
+            return np.full(len(points), np.inf)
+        return np.min([zone.distances(points) for zone in self.zones], axis=0)
+
+    def draw(self, frame):
+        for zone in self.zones:
+            zone.draw(frame)
+
+    def snapshot(self):
+        """Per-zone counts and geometry for the API"""
+        with self.lock:
+            counts = {name: {**zone_counts, "by_class": dict(zone_counts["by_class"])}
+                      for name, zone_counts in self.counts.items()}
+        return [
+            {
+                **zone.to_config(),
+                "inbound": counts[zone.name]["inbound"],
+                "outbound": counts[zone.name]["outbound"],
+                "total": counts[zone.name]["inbound"] + counts[zone.name]["outbound"],
+                "by_class": counts[zone.name]["by_class"],
+            }
+            for zone in self.zones
+        ]
@@ -0,0 +1,306 @@
+import threading
+import cv2
+import numpy as np
+from src.traffic_ai.vehicle_detection.ClassNames import ClassNames
+from src.traffic_ai.vehicle_detection.roi import non_max_suppression
+
+MODEL_PATH = "src/traffic_ai/vehicle_detection/image-weights/yolo11n.onnx"
+# Static INT8 model calibrated on our camera frames, written by scripts/quantize_detector.py
+INT8_MODEL_PATH = "src/traffic_ai/vehicle_detection/image-weights/yolo11n-int8.onnx"
+MODEL_VARIANTS = {"fp32": MODEL_PATH, "int8": INT8_MODEL_PATH}
+DETECTOR_BACKENDS = ("ultralytics", "onnxruntime", "openvino")
+
+
+def boxes_to_array(result):
+    """Compact detections of one YOLO result as a float32 array of [x1, y1, x2, y2, conf, cls] rows"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+
+    boxes = result.boxes
+    return np.column_stack((
+        boxes.xyxy.cpu().numpy(),
+        boxes.conf.cpu().numpy(),
+        boxes.cls.cpu().numpy()
+    )).astype(np.float32)
+
+
+def resolve_model(model=None):
+    """Model file of a variant name ("fp32", "int8"), any other value is a path used as is, None is the FP32 model"""
+    if model is None:
+        return MODEL_PATH
+    return MODEL_VARIANTS.get(model, model)
+
+
+def letterbox(frame, size, color=114):
+    """
+    Resize a frame into `size` (width, height) keeping its aspect ratio, padded evenly
+    with gray like ultralytics does. Returns (image, scale, (pad_x, pad_y))
+    """
+    height, width = frame.shape[:2]
+    scale = min(size[0] / width, size[1] / height)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size[0] - new_w) // 2, (size[1] - new_h) // 2
+
+    image = np.full((size[1], size[0], 3), color, dtype=np.uint8)
+    if (new_w, new_h) != (width, height):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    image[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = frame
+    return image, scale, (pad_x, pad_y)
+
+
+class YoloDetector:
+    """ultralytics YOLO model that can be shared by several pipelines, calls are serialized with a lock"""
+
+    backend = "ultralytics"
+
+    def __init__(self, model_path=MODEL_PATH, conf=0.3):
+        # Imported here so the other backends never load ultralytics (and torch)
+        from ultralytics import YOLO
+
+        self.model_path = model_path
+        self.model = YOLO(model_path, task='detect')
+        self.classes = ClassNames()
+        self.predict_args = {
+            "classes": self.classes.classified_vehicle(),
+            "verbose": False,
+            "conf": conf
+        }
+        self.batch_inference = True
+        self.lock = threading.Lock()
+
+    def predict(self, frames):
+        """Run YOLO on a list of frames in a single call, returns one detection array per frame"""
+        with self.lock:
+            if len(frames) > 1 and self.batch_inference:
+                try:
+                    results = self.model.predict(frames, **self.predict_args)
+                    return [boxes_to_array(r) for r in results]
+                except Exception as e:
+                    # Static-batch ONNX exports only accept one image per call,
+                    # export with dynamic=True (or batch=N) to enable batching
+                    print(f"⚠️ Batched inference failed ({e}), falling back to per-frame inference")
+                    self.batch_inference = False
+
+            return [boxes_to_array(self.model.predict(frame, **self.predict_args)[0]) for frame in frames]
+
+
+class LetterboxDetector:
+    """
+    Base of the backends running an exported YOLO graph: letterboxing, numpy decoding and per-class NMS.
+    Subclasses only implement `load` and `infer(blob)`
+    """
+
+    backend = None
+
+    def __init__(self, model_path=MODEL_PATH, conf=0.3, iou=0.7, image_size=640, max_det=300, threads=None):
+        self.model_path = model_path
+        self.conf = conf
+        self.iou = iou  # Same default NMS IoU as ultralytics' predict
+        self.max_det = max_det
+        self.threads = threads  # Intra-op threads, None for the runtime's default (one per core)
+        self.classes = np.array(ClassNames().classified_vehicle())
+        self.lock = threading.Lock()
+
+        # Input shape as [batch, channels, height, width], dynamic dimensions are None
+        self.model, input_shape = self.load()
+        batch, _, height, width = input_shape
+        self.max_batch = batch  # Fixed batch size of the export, None when dynamic
+        self.input_size = (width or image_size, height or image_size)
+
+    def load(self):
+        """Load the model, returns (model, input shape)"""
+        raise NotImplementedError
+
+    def infer(self, blob):
+        """Run one NCHW float32 blob, returns the raw (batch, 4 + classes, anchors) output"""
+        raise NotImplementedError
+
+    def preprocess(self, frames):
+        """Letterbox and stack BGR frames into an RGB NCHW float32 blob scaled to [0, 1]"""
+        images, transforms = [], []
+        for frame in frames:
+            image, scale, pad = letterbox(frame, self.input_size)
+            images.append(image)
+            transforms.append((scale, pad, frame.shape[1], frame.shape[0]))
+        blob = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32)
+        blob *= 1 / 255.0
+        return blob, transforms
+
+    def postprocess(self, output, transform):
+        """Decode one image's (4 + classes, anchors) output into [x1, y1, x2, y2, conf, cls] rows"""
+        scale, (pad_x, pad_y), width, height = transform
+        predictions = output.T
+        scores = predictions[:, 4 + self.classes]
+        best = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), best]
+        keep = conf >= self.conf
+        if not keep.any():
+            return np.empty((0, 6), dtype=np.float32)
+
+        cx, cy, w, h = predictions[keep, :4].T
+        boxes = np.column_stack((
+            (cx - w / 2 - pad_x) / scale,
+            (cy - h / 2 - pad_y) / scale,
+            (cx + w / 2 - pad_x) / scale,
+            (cy + h / 2 - pad_y) / scale,
+            conf[keep],
+            self.classes[best[keep]],
+        )).astype(np.float32)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+        return non_max_suppression(boxes, self.iou)[:self.max_det]
+
+    def predict(self, frames):
+        """Run the model on a list of frames in as few calls as the export allows, returns one detection array per frame"""
+        results = []
+        if not frames:
+            return results
+        step = self.max_batch or len(frames)
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            blob, transforms = self.preprocess(chunk)
+            if self.max_batch and len(chunk) < self.max_batch:
+                # A static-batch export needs a full batch, the padding images are ignored
+                blob = np.concatenate((blob, np.zeros((self.max_batch - len(chunk), *blob.shape[1:]), dtype=np.float32)))
+            with self.lock:
+                output = self.infer(blob)
+            results.extend(self.postprocess(output[i], transform) for i, transform in enumerate(transforms))
+        return results
+
+
+class OnnxRuntimeDetector(LetterboxDetector):
+    """YOLO ONNX export run by ONNX Runtime's CPU provider with our own pre/post-processing"""
+
+    backend = "onnxruntime"
+
+    def load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # One graph runs at a time, parallelism comes from the intra-op threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if self.threads:
+            options.intra_op_num_threads = int(self.threads)
+
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        return self.session, [dim if isinstance(dim, int) else None for dim in model_input.shape]
+
+    def infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoDetector(LetterboxDetector):
+    """
+    YOLO ONNX export (or OpenVINO IR .xml) compiled by OpenVINO for the CPU, an optional
+    dependency (pip install openvino) that is usually the fastest on Intel CPUs
+    """
+
+    backend = "openvino"
+
+    def __init__(self, model_path=MODEL_PATH, device="CPU", **options):
+        self.device = device
+        super().__init__(model_path, **options)
+
+    def load(self):
+        import openvino as ov
+
+        core = ov.Core()
+        model = core.read_model(self.model_path)
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if self.threads:
+            config["INFERENCE_NUM_THREADS"] = int(self.threads)
+        compiled = core.compile_model(model, self.device, config)
+        self.request = compiled.create_infer_request()
+
+        shape = model.input(0).get_partial_shape()
+        return compiled, [dim.get_length() if dim.is_static else None for dim in shape]
+
+    def infer(self, blob):
+        self.request.infer({0: blob})
+        return self.request.get_output_tensor(0).data.copy()
+
+
+def detector_options(backend, threads=None):
+    """create_detector options of a backend: intra-op `threads` for onnxruntime/openvino, ultralytics has none"""
+    return {"threads": int(threads)} if threads and backend != "ultralytics" else {}
+
+
+def create_detector(backend="ultralytics", model_path=None, **options):
+    """
+    Detector of one of DETECTOR_BACKENDS, every backend has the same predict(frames) interface.
+    `model_path` may also be a MODEL_VARIANTS name
+    """
+    detectors = {
+        "ultralytics": YoloDetector,
+        "onnxruntime": OnnxRuntimeDetector,
+        "openvino": OpenVinoDetector,
+    }
+    if backend not in detectors:
+        raise ValueError(f"Unknown detector backend '{backend}', use one of {DETECTOR_BACKENDS}")
+    return detectors[backend](resolve_model(model_path), **options)
+
+
+class BatchingDetector:
+    """Merges concurrent predict calls of several cameras into one batched call of the wrapped detector"""
+
+    def __init__(self, detector, max_batch=8, gather_window=0.005):
+        self.detector = detector
+        self.model = detector.model
+        self.max_batch = max_batch
+        self.gather_window = gather_window
+        self.pending = []
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.batch_worker, daemon=True)
+        self.worker.start()
+
+    def predict(self, frames):
+        request = {"frames": frames, "results": None, "error": None, "done": threading.Event()}
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+
+        request["done"].wait()
+        if request["error"] is not None:
+            raise request["error"]
+        return request["results"]
+
+    def take_batch(self):
+        """Wait for requests, then gather more until the window closes or the batch is full"""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+
+            self.condition.wait_for(
+                lambda: sum(len(r["frames"]) for r in self.pending) >= self.max_batch,
+                timeout=self.gather_window
+            )
+
+            batch, size = [], 0
+            while self.pending and (not batch or size + len(self.pending[0]["frames"]) <= self.max_batch):
+                request = self.pending.pop(0)
+                batch.append(request)
+                size += len(request["frames"])
+            return batch
+
+    def batch_worker(self):
+        while True:
+            batch = self.take_batch()
+            frames = [frame for request in batch for frame in request["frames"]]
+            try:
+                results = self.detector.predict(frames)
+                # Fan results back out to the cameras they came from
+                offset = 0
+                for request in batch:
+                    count = len(request["frames"])
+                    request["results"] = results[offset:offset + count]
+                    offset += count
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+
+            for request in batch:
+                request["done"].set()
@@ -0,0 +1,276 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+OUTBOX_PATH = "cache/firebase_outbox.db"
+
+
+class PushIdGenerator:
+    """Firebase push keys generated locally, sorting in creation order like the ones `ref.push()` returns"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_time = 0
+        self.last_random = [0] * 12
+
+    def __call__(self):
+        with self.lock:
+            now = int(time.time() * 1000)
+            if now == self.last_time:
+                # Same millisecond: increment the random part so the order is kept
+                i = 11
+                while i >= 0 and self.last_random[i] == 63:
+                    self.last_random[i] = 0
+                    i -= 1
+                if i >= 0:
+                    self.last_random[i] += 1
+            else:
+                self.last_random = [random.randrange(64) for _ in range(12)]
+            self.last_time = now
+
+            stamp = []
+            for _ in range(8):
+                stamp.append(PUSH_CHARS[now % 64])
+                now //= 64
+            return "".join(reversed(stamp)) + "".join(PUSH_CHARS[i] for i in self.last_random)
+
+
+push_id = PushIdGenerator()
+
+
+def increment(delta):
+    """Firebase server value adding `delta` to what is stored, so concurrent or replayed counts never overwrite each other"""
+    return {".sv": {"increment": delta}}
+
+
+def increment_delta(value):
+    """The delta of an increment() value, None for any other value"""
+    if isinstance(value, dict) and len(value) == 1 and isinstance(value.get(".sv"), dict):
+        return value[".sv"].get("increment")
+    return None
+
+
+def overlaps(path, paths):
+    """True when `path` is an ancestor or descendant of one of `paths`, which one multi-path update rejects"""
+    return any(path.startswith(other + "/") or other.startswith(path + "/") for other in paths)
+
+
+class FirebaseWriteBehind:
+    """
+    Firebase writes through a durable SQLite outbox, sent as batched multi-path updates with retries.
+    Pending increments of a path are summed into one row, never the one being sent
+    """
+
+    def __init__(self, send, path=OUTBOX_PATH, flush_interval=5.0, batch_size=500, max_pending=500_000,
+                 backoff=1.0, max_backoff=60.0):
+        self.send = send  # Callable taking {path: value} and writing it to Firebase in one update
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL only fsyncs at checkpoints, a committed row still survives a process crash
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL, "
+            "coalesce_key TEXT UNIQUE)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")]
+        if "coalesce_key" not in columns:  # Outbox written before coalescing existed
+            self.conn.execute("ALTER TABLE outbox ADD COLUMN coalesce_key TEXT")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_coalesce_key ON outbox (coalesce_key)")
+        self.pending = self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.sending_upto = 0  # Last row ID of the batch being sent, rows up to it are left alone
+
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.failures = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_error = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.flush_loop, daemon=True)
+            self.thread.start()
+        return self
+
+    def enqueue(self, path, action, data):
+        """
+        Append a 'set', 'update', 'increment' (of each key by its value) or 'push' of `data` at
+        `path` to the outbox. An increment is added to a pending one of the same path
+        """
+        path = "/" + path.strip("/")
+        if action == "update":
+            rows = [(f"{path}/{key}", value) for key, value in data.items()]
+        elif action == "increment":
+            rows = [(f"{path}/{key}", increment(delta)) for key, delta in data.items()]
+        elif action == "push":
+            rows = [(f"{path}/{push_id()}", data)]
+        elif action == "set":
+            rows = [(path, data)]
+        else:
+            raise ValueError(f"Unknown Firebase action '{action}'")
+
+        now = time.time()
+        with self.lock:
+            if action == "increment":
+                rows = [row for row in rows if not self.coalesce_increment(*row)]
+            self.conn.executemany(
+                "INSERT INTO outbox (path, value, created, coalesce_key) VALUES (?, ?, ?, ?)",
+                [(row_path, json.dumps(value), now, row_path if action == "increment" else None)
+                 for row_path, value in rows]
+            )
+            self.pending += len(rows)
+            if self.pending > self.max_pending:
+                self.drop_oldest(self.pending - self.max_pending)
+            full = self.pending > self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def coalesce_increment(self, path, value):
+        """
+        Add an increment to the pending one of `path`, returns False when it needs a row of
+        its own. Called under the lock
+        """
+        row = self.conn.execute("SELECT id, value FROM outbox WHERE coalesce_key = ?", (path,)).fetchone()
+        if row is None:
+            return False
+        row_id, pending = row[0], increment_delta(json.loads(row[1]))
+        if row_id <= self.sending_upto or pending is None:
+            # Being sent (or a total queued before increments existed): it keeps its value
+            # and the new delta starts the next pending row of the path
+            self.conn.execute("UPDATE outbox SET coalesce_key = NULL WHERE id = ?", (row_id,))
+            return False
+        self.conn.execute(
+            "UPDATE outbox SET value = ? WHERE id = ?",
+            (json.dumps(increment(pending + increment_delta(value))), row_id)
+        )
+        self.coalesced += 1
+        return True
+
+    def drop_oldest(self, count):
+        """Called under the lock"""
+        self.conn.execute("DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (count,))
+        self.pending -= count
+        self.dropped += count
+        logging.warning(f"Firebase outbox full, dropped the {count} oldest writes")
+
+    def next_batch(self):
+        """
+        Oldest rows as (last row ID, {path: value}), cut before a path that overlaps one already
+        in the batch. Called under the lock, the rows stay untouched until sending_upto is reset
+        """
+        rows = self.conn.execute(
+            "SELECT id, path, value FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+        ).fetchall()
+
+        updates, last_id = {}, None
+        for row_id, path, value in rows:
+            value = json.loads(value)
+            if path in updates:
+                delta, pending = increment_delta(value), increment_delta(updates[path])
+                if delta is not None:
+                    # Increments of one path add up, one after a plain write waits for the next batch
+                    if pending is None:
+                        break
+                    value = increment(pending + delta)
+            elif overlaps(path, updates):
+                break
+            # Later writes to the same path win, like they would one after the other
+            updates[path] = value
+            last_id = row_id
+        return last_id, updates
+
+    def pending_increments(self, path):
+        """{key: summed delta} of the increments of `path`'s children not sent yet"""
+        prefix = "/" + path.strip("/") + "/"
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, value FROM outbox WHERE substr(path, 1, ?) = ? ORDER BY id", (len(prefix), prefix)
+            ).fetchall()
+        deltas = {}
+        for row_path, value in rows:
+            key, delta = row_path[len(prefix):], increment_delta(json.loads(value))
+            if delta is not None and "/" not in key:
+                deltas[key] = deltas.get(key, 0) + delta
+        return deltas
+
+    def flush(self):
+        """Send one batch, returns the number of rows written (0 when the outbox is empty)"""
+        with self.lock:
+            last_id, updates = self.next_batch()
+            if last_id is None:
+                return 0
+            self.sending_upto = last_id
+
+        try:
+            self.send({path.lstrip("/"): value for path, value in updates.items()})
+        except Exception:
+            with self.lock:
+                self.sending_upto = 0
+            raise
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM outbox WHERE id <= ?", (last_id,)).rowcount
+            self.pending -= deleted
+            self.sending_upto = 0
+        self.flushed += deleted
+        print(f"Firebase: {deleted} writes flushed as one update ({len(updates)} paths)")
+        return deleted
+
+    def flush_loop(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                # Keep going while full batches are waiting
+                while self.flush() >= self.batch_size and not self.stopping.is_set():
+                    pass
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1)) * random.uniform(0.5, 1.0)
+                logging.error(f"Firebase flush failed ({self.failures}x), retrying in {delay:.1f}s: {e}")
+                self.stopping.wait(delay)
+
+    def stop(self, timeout=10):
+        """Stop the flush thread after a last attempt to send what is pending"""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            logging.error(f"Final Firebase flush failed, {self.pending} writes stay in {self.path}: {e}")
+
+    def status(self):
+        with self.lock:
+            pending = self.pending
+        return {
+            "pending": pending,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
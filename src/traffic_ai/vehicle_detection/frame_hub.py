@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import cv2
+
+STREAM_TYPES = ("raw", "processed")
+
+
+class FrameBroadcastHub:
+    """JPEG-encodes each new frame of a camera once per watched stream type and shares the bytes with every viewer"""
+
+    def __init__(self, jpeg_quality=85):
+        self.jpeg_quality = jpeg_quality
+        self.pipeline = None
+        self.condition = threading.Condition()
+        self.latest = {stream_type: (0, None) for stream_type in STREAM_TYPES}  # (sequence, jpeg bytes)
+        self.subscribers = {stream_type: 0 for stream_type in STREAM_TYPES}
+        self.waiters = {stream_type: set() for stream_type in STREAM_TYPES}  # (event loop, future)
+        self.encoded_ids = {stream_type: None for stream_type in STREAM_TYPES}  # Pipeline frame ID last encoded
+        self.dirty = set()
+        self.dirty_event = threading.Event()
+        self.thread = threading.Thread(target=self.encode_loop, daemon=True)
+        self.thread.start()
+
+    def attach(self, pipeline):
+        """Use `pipeline` as the frame source, previously encoded frames are dropped"""
+        with self.condition:
+            self.pipeline = pipeline
+            for stream_type in STREAM_TYPES:
+                sequence, _ = self.latest[stream_type]
+                self.latest[stream_type] = (sequence, None)
+                self.encoded_ids[stream_type] = None
+
+    def publish(self, stream_type):
+        """Called by the pipeline when a new frame of `stream_type` is available"""
+        with self.condition:
+            self.dirty.add(stream_type)
+        self.dirty_event.set()
+
+    def subscribe(self, stream_type):
+        with self.condition:
+            self.subscribers[stream_type] += 1
+        # Encode the current frame right away so a new viewer does not wait for the next one
+        self.publish(stream_type)
+
+    def unsubscribe(self, stream_type):
+        with self.condition:
+            self.subscribers[stream_type] = max(0, self.subscribers[stream_type] - 1)
+
+    def has_subscribers(self, stream_type):
+        with self.condition:
+            return self.subscribers[stream_type] > 0
+
+    def latest_frame(self, stream_type):
+        """Latest (sequence, jpeg bytes) of a stream, bytes are None until a frame was encoded"""
+        with self.condition:
+            return self.latest[stream_type]
+
+    async def next_frame(self, stream_type, last_sequence, timeout=None):
+        """
+        Wait until a frame newer than `last_sequence` is encoded, returns (sequence, jpeg bytes).
+        On timeout the current latest frame is returned, which may be the same sequence.
+        """
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            sequence, frame_bytes = self.latest[stream_type]
+            if sequence > last_sequence and frame_bytes is not None:
+                return sequence, frame_bytes
+            waiter = (loop, loop.create_future())
+            self.waiters[stream_type].add(waiter)
+
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self.waiters[stream_type].discard(waiter)
+
+        return self.latest_frame(stream_type)
+
+    @staticmethod
+    def wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    def encode_loop(self):
+        while True:
+            self.dirty_event.wait()
+            with self.condition:
+                self.dirty_event.clear()
+                pending = [t for t in self.dirty if self.subscribers[t] > 0]
+                self.dirty.clear()
+                pipeline = self.pipeline
+
+            if pipeline is None:
+                continue
+
+            for stream_type in pending:
+                try:
+                    frame_id, frame = pipeline.get_stream_frame(stream_type)
+                    # Nothing new since the last encode (e.g. skipped frames), viewers keep waiting
+                    if frame is None or frame_id == self.encoded_ids[stream_type]:
+                        continue
+                    with pipeline.metrics.time(f"jpeg_encode_{stream_type}"):
+                        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                    if not ok:
+                        continue
+                except Exception as e:
+                    print(f"Frame encode error ({stream_type}): {e}")
+                    continue
+
+                with self.condition:
+                    if self.pipeline is not pipeline:
+                        continue  # Re-attached while encoding
+                    self.encoded_ids[stream_type] = frame_id
+                    sequence, _ = self.latest[stream_type]
+                    self.latest[stream_type] = (sequence + 1, jpeg.tobytes())
+                    self.condition.notify_all()
+                    waiters = list(self.waiters[stream_type])
+                    self.waiters[stream_type].clear()
+
+                # Resolve async viewers on their own event loop
+                for loop, future in waiters:
+                    try:
+                        loop.call_soon_threadsafe(self.wake, future)
+                    except RuntimeError:
+                        pass  # The viewer's event loop is already closed
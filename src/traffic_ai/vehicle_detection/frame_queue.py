@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+
+
+class DropOldestQueue:
+    """Bounded queue between two pipeline stages, a full queue drops its oldest item (or with `block`, waits for room)"""
+
+    def __init__(self, maxsize=2, block=False):
+        self.maxsize = max(1, int(maxsize))
+        self.block = block
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Add an item, dropping the oldest one (or waiting for room) if the queue is full. Returns False once closed"""
+        with self.condition:
+            while self.block and len(self.items) >= self.maxsize and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return False
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Wait for the next item, returns None on timeout or when the queue is closed and empty"""
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            return self.pop()
+
+    def get_nowait(self):
+        """Return the next item without waiting, or None if the queue is empty"""
+        with self.condition:
+            return self.pop()
+
+    def pop(self):
+        """Called under the condition, wakes a producer waiting for room"""
+        if not self.items:
+            return None
+        self.condition.notify_all()
+        return self.items.popleft()
+
+    def qsize(self):
+        with self.condition:
+            return len(self.items)
+
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+            self.condition.notify_all()
+
+    def close(self):
+        """Wake up every waiting consumer, further puts are ignored"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def reopen(self):
+        with self.condition:
+            self.closed = False
+            self.items.clear()
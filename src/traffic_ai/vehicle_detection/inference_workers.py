@@ -0,0 +1,246 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+from src.traffic_ai.vehicle_detection.detector import MODEL_PATH, detector_options
+
+FRAME_SHAPE = (270, 480, 3)  # Pipeline frames are resized to 480x270
+
+
+class SharedFrameRing:
+    """Fixed number of frame slots in one shared memory block, workers get slot indexes instead of pickled frames"""
+
+    def __init__(self, shm, slots, frame_shape, owner):
+        self.shm = shm
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.owner = owner
+        self.frames = np.ndarray((slots, *self.frame_shape), dtype=np.uint8, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, slots, frame_shape=FRAME_SHAPE):
+        size = slots * int(np.prod(frame_shape))
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        return cls(shm, slots, frame_shape, owner=True)
+
+    @classmethod
+    def attach(cls, name, slots, frame_shape=FRAME_SHAPE):
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, slots, frame_shape, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        # Drop the numpy view first, the buffer cannot be closed while it is exported
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def inference_worker(backend, model_path, threads, ring_name, slots, frame_shape, tasks, results):
+    """Worker process: load its own detector and detect on frames read from the ring"""
+    # Imported here so the parent process never loads a second copy of the model
+    from src.traffic_ai.vehicle_detection.detector import create_detector
+
+    ring = SharedFrameRing.attach(ring_name, slots, frame_shape)
+    detector = create_detector(backend, model_path, **detector_options(backend, threads))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        request_id, frame_slots = task
+        try:
+            # ROI crops are smaller than a slot, only their top-left part is used
+            frames = [ring.frames[slot][:height, :width] for slot, height, width in frame_slots]
+            # Only compact [x1, y1, x2, y2, conf, cls] arrays travel back
+            results.put((request_id, detector.predict(frames), None))
+        except Exception as e:
+            results.put((request_id, None, str(e)))
+
+    ring.close()
+
+
+class ProcessInferencePool:
+    """
+    YoloDetector.predict replacement running the model in worker processes.
+    A call takes all its ring slots at once, workers that time out are replaced
+    """
+
+    def __init__(self, num_workers=None, slots=8, frame_shape=FRAME_SHAPE, model_path=MODEL_PATH, timeout=30,
+                 backend="ultralytics", threads=None):
+        self.backend = backend
+        self.threads = threads  # Intra-op threads of each worker's detector, None for the runtime's default
+        self.model_path = model_path
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.timeout = timeout  # Seconds to wait for a worker before giving up on a request
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.model = None  # The model only lives inside the workers
+        self.ring = SharedFrameRing.create(slots, self.frame_shape)
+
+        self.free_slots = list(range(slots))
+        self.slot_condition = threading.Condition()
+        # Bumped by every restart, slots taken before it are never handed back
+        self.generation = 0
+        self.restarts = 0
+
+        # spawn keeps the workers free of the parent's threads and locks
+        self.ctx = mp.get_context("spawn")
+        self.start_workers()
+
+        self.request_ids = itertools.count()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.running = True
+        self.collector = threading.Thread(target=self.collect_results, daemon=True)
+        self.collector.start()
+
+    def start_workers(self):
+        """Fresh task/result queues and worker processes, a terminated worker may have left the old ones corrupt"""
+        self.tasks = self.ctx.Queue()
+        self.results = self.ctx.Queue()
+        self.workers = [
+            self.ctx.Process(
+                target=inference_worker,
+                args=(self.backend, self.model_path, self.threads, self.ring.name, self.slots, self.frame_shape,
+                      self.tasks, self.results),
+                daemon=True
+            )
+            for _ in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def acquire_slots(self, count):
+        """Wait until `count` slots are free and take them together, returns (slots, generation)"""
+        with self.slot_condition:
+            # Blocks while the workers are behind (backpressure on the inference stage)
+            while len(self.free_slots) < count:
+                if not self.running:
+                    raise RuntimeError("Inference worker failed: inference pool closed")
+                self.slot_condition.wait()
+            taken, self.free_slots = self.free_slots[:count], self.free_slots[count:]
+            return taken, self.generation
+
+    def release_slots(self, frame_slots, generation):
+        with self.slot_condition:
+            # After a restart the ring is free again as a whole
+            if generation == self.generation:
+                self.free_slots.extend(frame_slots)
+                self.slot_condition.notify_all()
+
+    def predict(self, frames):
+        """Copy frames into the ring, wait for a worker, returns one detection array per frame"""
+        for frame in frames:
+            if (frame.ndim != 3 or frame.shape[2] != self.frame_shape[2]
+                    or frame.shape[0] > self.frame_shape[0] or frame.shape[1] > self.frame_shape[1]):
+                raise ValueError(f"Frame shape {frame.shape} does not fit the ring's {self.frame_shape}")
+
+        results = []
+        for start in range(0, len(frames), self.slots):
+            results.extend(self.predict_chunk(frames[start:start + self.slots]))
+        return results
+
+    def predict_chunk(self, frames):
+        """predict() of at most `slots` frames"""
+        frame_slots, generation = self.acquire_slots(len(frames))
+        timed_out = False
+        try:
+            for slot, frame in zip(frame_slots, frames):
+                self.ring.frames[slot][:frame.shape[0], :frame.shape[1]] = frame
+
+            request = {"done": threading.Event(), "results": None, "error": None}
+            request_id = next(self.request_ids)
+            with self.pending_lock:
+                self.pending[request_id] = request
+            self.tasks.put((request_id, [(slot, frame.shape[0], frame.shape[1])
+                                         for slot, frame in zip(frame_slots, frames)]))
+
+            if not request["done"].wait(timeout=self.timeout):
+                with self.pending_lock:
+                    self.pending.pop(request_id, None)
+                request["error"] = f"no result after {self.timeout}s"
+                timed_out = True
+        finally:
+            if timed_out:
+                # A worker may still be reading these slots, none are reused until it is gone
+                self.restart(generation, request["error"])
+            else:
+                # Workers are done reading once the result arrived
+                self.release_slots(frame_slots, generation)
+
+        if request["error"] is not None:
+            raise RuntimeError(f"Inference worker failed: {request['error']}")
+        return request["results"]
+
+    def restart(self, generation, reason):
+        """Replace every worker (once per generation) and free the whole ring again"""
+        with self.slot_condition:
+            if generation != self.generation or not self.running:
+                return
+            print(f"Restarting inference workers: {reason}")
+            self.generation += 1
+            self.restarts += 1
+            for worker in self.workers:
+                worker.terminate()
+            for worker in self.workers:
+                worker.join(timeout=5)
+            self.fail_pending(f"inference workers restarted ({reason})")
+            self.start_workers()
+            self.free_slots = list(range(self.slots))
+            self.slot_condition.notify_all()
+
+    def fail_pending(self, error):
+        """Wake up every caller still waiting for a result"""
+        with self.pending_lock:
+            for request in self.pending.values():
+                request["error"] = error
+                request["done"].set()
+            self.pending.clear()
+
+    def collect_results(self):
+        """Route worker results back to the waiting callers"""
+        while self.running:
+            results = self.results
+            try:
+                request_id, detections, error = results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                if results is self.results:
+                    break
+                continue  # Queue of the workers a restart replaced
+
+            with self.pending_lock:
+                request = self.pending.pop(request_id, None)
+            if request is None:
+                continue
+            request["results"] = detections
+            request["error"] = error
+            request["done"].set()
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        with self.slot_condition:
+            self.running = False
+            self.slot_condition.notify_all()
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+        # Wake up anyone still waiting
+        self.fail_pending("inference pool closed")
+
+        self.collector.join(timeout=2)
+        self.ring.close()
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageStats:
+    """Durations of one pipeline stage: a rolling window for quantiles plus lifetime count and sum"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+
+class PipelineMetrics:
+    """Per-stage timings (last `window` samples), counters and registered gauges of one camera pipeline"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.sources = {}  # name -> ("counter" or "gauge", callable returning the current value)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.window)
+            stats.add(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a with block as `stage`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def increment(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def gauge(self, name, read):
+        """Register a callable read on every snapshot, e.g. a queue's current depth"""
+        with self.lock:
+            self.sources[name] = ("gauge", read)
+
+    def counter(self, name, read):
+        """Register a callable returning an ever increasing count kept elsewhere, e.g. a queue's drops"""
+        with self.lock:
+            self.sources[name] = ("counter", read)
+
+    def snapshot(self):
+        """Quantiles in milliseconds per stage plus counters and gauges, as plain dicts"""
+        with self.lock:
+            stages = {name: (list(stats.samples), stats.count, stats.total) for name, stats in self.stages.items()}
+            counters = dict(self.counters)
+            sources = dict(self.sources)
+
+        stage_stats = {}
+        for name, (samples, count, total) in stages.items():
+            window = np.asarray(samples) * 1000
+            p50, p95, p99 = np.percentile(window, [q * 100 for q in QUANTILES]) if len(window) else (0.0, 0.0, 0.0)
+            stage_stats[name] = {
+                "count": count,
+                "sum_ms": round(total * 1000, 3),
+                "mean_ms": round(float(window.mean()), 3) if len(window) else 0.0,
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(window.max()), 3) if len(window) else 0.0,
+            }
+
+        gauges = {}
+        for name, (kind, read) in sources.items():
+            try:
+                value = read()
+            except Exception:
+                continue  # The source went away (pipeline stopped)
+            (counters if kind == "counter" else gauges)[name] = value
+        return {"stages": stage_stats, "counters": counters, "gauges": gauges}
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(snapshots, prefix="traffic_pipeline"):
+    """Render {camera ID: PipelineMetrics.snapshot()} in the Prometheus text exposition format"""
+    lines = [
+        f"# HELP {prefix}_stage_seconds Pipeline stage duration over the recent window",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for camera_id, snapshot in snapshots.items():
+        for stage, stats in snapshot["stages"].items():
+            labels = f'camera_id="{label_value(camera_id)}",stage="{label_value(stage)}"'
+            for quantile, key in zip(QUANTILES, ("p50_ms", "p95_ms", "p99_ms")):
+                lines.append(f'{prefix}_stage_seconds{{{labels},quantile="{quantile}"}} {stats[key] / 1000:.6f}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {stats['sum_ms'] / 1000:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {stats['count']}")
+
+    counter_names = sorted({name for snapshot in snapshots.values() for name in snapshot["counters"]})
+    for name in counter_names:
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        for camera_id, snapshot in snapshots.items():
+            if name in snapshot["counters"]:
+                lines.append(f'{prefix}_{name}_total{{camera_id="{label_value(camera_id)}"}} {snapshot["counters"][name]}')
+
+    gauge_names = sorted({name for snapshot in snapshots.values() for name in snapshot["gauges"]})
+    for name in gauge_names:
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        for camera_id, snapshot in snapshots.items():
+            if name in snapshot["gauges"]:
+                lines.append(f'{prefix}_{name}{{camera_id="{label_value(camera_id)}"}} {snapshot["gauges"][name]}')
+    return "\n".join(lines) + "\n"
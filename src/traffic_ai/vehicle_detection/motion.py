@@ -0,0 +1,57 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Running-average background check that lets the pipeline skip YOLO while nothing moves on the road"""
+
+    def __init__(self, box=None, scale=0.25, threshold=25, min_changed=0.002, learning_rate=0.05, keepalive=5.0):
+        self.box = box  # [x1, y1, x2, y2] in frame coordinates, None for the whole frame
+        self.scale = scale
+        self.threshold = threshold  # Gray level difference of a changed pixel
+        self.min_changed = min_changed  # Fraction of changed pixels that counts as motion
+        self.learning_rate = learning_rate
+        self.keepalive = keepalive
+        self.background = None
+        self.last_open = None
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def small_gray(self, frame):
+        if self.box is not None:
+            x1, y1, x2, y2 = self.box
+            frame = frame[y1:y2, x1:x2]
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+    def has_motion(self, frame, now=None):
+        """True when the frame differs enough from the background (or the keepalive is due)"""
+        now = time.monotonic() if now is None else now
+        gray = self.small_gray(frame)
+        with self.lock:
+            self.checked += 1
+            if self.background is None or self.background.shape != gray.shape:
+                self.background = gray
+                self.last_open = now
+                return True
+
+            changed = np.count_nonzero(cv2.absdiff(gray, self.background) > self.threshold) / gray.size
+            cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+            if changed >= self.min_changed or now - self.last_open >= self.keepalive:
+                self.last_open = now
+                return True
+            self.skipped += 1
+            return False
+
+    def status(self):
+        with self.lock:
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skipped_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            }
@@ -0,0 +1,191 @@
+import threading
+from src.traffic_ai.vehicle_detection.detector import BatchingDetector, create_detector, detector_options, resolve_model
+from src.traffic_ai.vehicle_detection.inference_workers import ProcessInferencePool
+from src.traffic_ai.vehicle_detection.frame_hub import FrameBroadcastHub
+from src.traffic_ai.vehicle_detection.vehicle_counter import (
+    OptimizedDetectionPipeline, DEFAULT_CAMERA_ID, stop_event_dispatchers, stop_firebase_writer
+)
+
+# Frame slots of a shared worker pool: a full batch (the start schema allows 16) of two cameras
+PROCESS_POOL_SLOTS = 32
+
+
+class PipelineManager:
+    """Runs one OptimizedDetectionPipeline per camera ID, sharing detectors (or inference pools) and broadcast hubs"""
+
+    def __init__(self):
+        self.pipelines = {}
+        self.threads = {}
+        self.hubs = {}
+        self.lock = threading.Lock()
+        self.detectors = {}  # (detector backend, model path, threads) -> shared BatchingDetector
+        self.process_pools = {}  # (detector backend, model path, threads) -> shared ProcessInferencePool
+        self.detector_lock = threading.Lock()
+
+    def get_detector(self, backend="ultralytics", model=None, threads=None):
+        """Load the shared model of a detector backend on first use"""
+        key = (backend, resolve_model(model), threads or None)
+        with self.detector_lock:
+            if key not in self.detectors:
+                self.detectors[key] = BatchingDetector(
+                    create_detector(backend, key[1], **detector_options(backend, threads))
+                )
+            return self.detectors[key]
+
+    def get_process_pool(self, backend="ultralytics", model=None, threads=None):
+        """Start the shared inference worker processes of a detector backend on first use"""
+        key = (backend, resolve_model(model), threads or None)
+        with self.detector_lock:
+            if key not in self.process_pools:
+                self.process_pools[key] = ProcessInferencePool(
+                    slots=PROCESS_POOL_SLOTS, model_path=key[1], backend=backend, threads=threads
+                )
+            return self.process_pools[key]
+
+    def run_pipeline(self, pipeline):
+        """Pipeline thread target, loads the shared model off the request thread"""
+        try:
+            if pipeline.execution_mode == "process":
+                pipeline.detector = self.get_process_pool(
+                    pipeline.detector_backend, pipeline.detector_model, pipeline.detector_threads
+                )
+            else:
+                pipeline.detector = self.get_detector(
+                    pipeline.detector_backend, pipeline.detector_model, pipeline.detector_threads
+                )
+        except Exception as e:
+            print(f"Failed to load shared detector for camera {pipeline.camera_id}: {e}")
+            return
+        pipeline.run()
+
+    def start(self, camera_id, camera_source, detection_mode="processed", batch_size=1, execution_mode="thread",
+              counting_zones=None, roi=None, target_fps=10.0, motion_gating=True, detector_backend="ultralytics",
+              detector_model=None, event_sinks=None, detector_threads=None):
+        """Start a pipeline for `camera_id` in its own thread, replacing a stopped one"""
+        with self.lock:
+            existing = self.pipelines.get(camera_id)
+            if existing and existing.running:
+                existing.stop()
+            thread = self.threads.get(camera_id)
+            if thread and thread.is_alive():
+                thread.join(timeout=5)
+
+            pipeline = OptimizedDetectionPipeline(
+                camera_source, detection_mode, batch_size,
+                camera_id=camera_id, execution_mode=execution_mode, counting_zones=counting_zones,
+                roi=roi, target_fps=target_fps, motion_gating=motion_gating, detector_backend=detector_backend,
+                detector_model=detector_model, event_sinks=event_sinks, detector_threads=detector_threads
+            )
+            hub = self.hubs.setdefault(camera_id, FrameBroadcastHub())
+            pipeline.hub = hub
+            hub.attach(pipeline)
+
+            thread = threading.Thread(target=self.run_pipeline, args=(pipeline,), daemon=True)
+            self.pipelines[camera_id] = pipeline
+            self.threads[camera_id] = thread
+            thread.start()
+            return pipeline
+
+    def stop(self, camera_id, timeout=10):
+        """Stop a camera's pipeline and wait for its thread, returns False if it is unknown"""
+        with self.lock:
+            pipeline = self.pipelines.get(camera_id)
+            thread = self.threads.pop(camera_id, None)
+
+        if pipeline is None:
+            return False
+
+        pipeline.stop()
+        if thread and thread.is_alive():
+            thread.join(timeout=timeout)
+        return True
+
+    def stop_all(self):
+        for camera_id in self.camera_ids():
+            self.stop(camera_id)
+
+        with self.detector_lock:
+            for process_pool in self.process_pools.values():
+                process_pool.close()
+            self.process_pools.clear()
+
+        # Write what the sinks still buffer (the Firebase sink into the outbox), then send what
+        # the outbox holds, the rest is picked up on the next start
+        stop_event_dispatchers()
+        stop_firebase_writer()
+
+    def get(self, camera_id=DEFAULT_CAMERA_ID):
+        with self.lock:
+            return self.pipelines.get(camera_id)
+
+    def get_hub(self, camera_id=DEFAULT_CAMERA_ID):
+        """Broadcast hub of a camera, created on first use so viewers can connect before the camera starts"""
+        with self.lock:
+            return self.hubs.setdefault(camera_id, FrameBroadcastHub())
+
+    def camera_ids(self):
+        with self.lock:
+            return list(self.pipelines.keys())
+
+    def status(self, camera_id=DEFAULT_CAMERA_ID):
+        """Status of one camera's pipeline"""
+        pipeline = self.get(camera_id)
+        if pipeline is None:
+            return {
+                "camera_id": camera_id,
+                "running": False,
+                "message": "Pipeline not initialized"
+            }
+
+        return {
+            "camera_id": camera_id,
+            "running": pipeline.running,
+            "camera_source": pipeline.camera_source,
+            "detection_mode": pipeline.detection_mode,
+            "batch_size": pipeline.batch_size,
+            "execution_mode": pipeline.execution_mode,
+            "detector_backend": pipeline.detector_backend,
+            "detector_model": resolve_model(pipeline.detector_model),
+            "detector_threads": pipeline.detector_threads,
+            "counting_zones": [zone.to_config() for zone in pipeline.zone_counter.zones],
+            "roi": pipeline.roi.to_config() if pipeline.roi is not None else None,
+            "scheduler": pipeline.scheduler.status(),
+            "motion_gate": pipeline.motion_gate.status() if pipeline.motion_gate is not None else None,
+            "event_sinks": pipeline.events.status() if pipeline.events is not None else {},
+            "message": "Pipeline running" if pipeline.running else "Pipeline stopped"
+        }
+
+    def all_status(self):
+        return [self.status(camera_id) for camera_id in self.camera_ids()]
+
+    def metrics(self, camera_id=None):
+        """{camera ID: metrics snapshot} of one camera, or of every camera when none is given"""
+        camera_ids = self.camera_ids() if camera_id is None else [camera_id]
+        snapshots = {}
+        for cid in camera_ids:
+            pipeline = self.get(cid)
+            if pipeline is not None:
+                snapshots[cid] = pipeline.metrics.snapshot()
+        return snapshots
+
+
+# Process wide manager
+pipeline_manager = PipelineManager()
+
+
+def get_pipeline(camera_id=DEFAULT_CAMERA_ID):
+    """Get the pipeline of a camera, the default camera if none is given"""
+    return pipeline_manager.get(camera_id)
+
+
+def stop_pipeline(camera_id=DEFAULT_CAMERA_ID):
+    """Stop a camera's pipeline"""
+    return pipeline_manager.stop(camera_id)
+
+
+def set_detection_mode(mode: str, camera_id=DEFAULT_CAMERA_ID):
+    """Set detection mode for a camera's pipeline"""
+    pipeline = pipeline_manager.get(camera_id)
+    if pipeline:
+        return pipeline.set_detection_mode(mode)
+    return False
@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+from src.traffic_ai.vehicle_detection.counting_zones import points_in_polygon
+
+FRAME_SIZE = (480, 270)  # (width, height) every pipeline frame is resized to
+
+
+def non_max_suppression(boxes, iou_threshold=0.5):
+    """
+    Greedy per-class NMS over [x1, y1, x2, y2, conf, cls] rows, returns the kept rows by
+    descending confidence. Used to drop the duplicates of a vehicle seen by two overlapping tiles.
+    """
+    if len(boxes) < 2:
+        return boxes
+    # Shift every class into its own coordinate range so one pass never merges two classes
+    offsets = boxes[:, 5:6] * (boxes[:, :4].max() + 1)
+    xyxy = boxes[:, :4] + offsets
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    order = np.argsort(-boxes[:, 4], kind="stable")
+
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.clip(np.minimum(xyxy[i, 2], xyxy[rest, 2]) - np.maximum(xyxy[i, 0], xyxy[rest, 0]), 0, None)
+        h = np.clip(np.minimum(xyxy[i, 3], xyxy[rest, 3]) - np.maximum(xyxy[i, 1], xyxy[rest, 1]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return boxes[keep]
+
+
+def tile_starts(start, end, tile, overlap):
+    """Start offsets of tiles of length `tile` covering [start, end), the last one flush with `end`"""
+    if end - start <= tile:
+        return [start]
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(start, end - tile, stride))
+    starts.append(end - tile)
+    return starts
+
+
+class RegionOfInterest:
+    """Road area of one camera sent to YOLO: a box, an optional polygon mask and optional native resolution tiles"""
+
+    def __init__(self, box=None, polygon=None, native_tiles=False, tile_size=FRAME_SIZE, tile_overlap=0.2,
+                 frame_size=FRAME_SIZE):
+        self.frame_size = tuple(frame_size)
+        self.polygon = None if polygon is None else np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if self.polygon is not None and len(self.polygon) < 3:
+            raise ValueError("ROI polygon needs at least 3 points")
+
+        if box is None:
+            if self.polygon is not None:
+                box = [*self.polygon.min(axis=0), *self.polygon.max(axis=0)]
+            else:
+                box = [0, 0, *self.frame_size]
+        x1, y1, x2, y2 = (int(round(v)) for v in box)
+        x1, x2 = max(0, min(x1, x2)), min(self.frame_size[0], max(x1, x2))
+        y1, y2 = max(0, min(y1, y2)), min(self.frame_size[1], max(y1, y2))
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            raise ValueError(f"ROI box {box} is empty inside the {self.frame_size[0]}x{self.frame_size[1]} frame")
+        self.box = (x1, y1, x2, y2)
+
+        self.native_tiles = bool(native_tiles)
+        self.tile_size = tuple(int(v) for v in tile_size)
+        self.tile_overlap = float(tile_overlap)
+        self.masks = {}  # (scale, crop box) -> polygon mask of that crop, built once per camera resolution
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Build an ROI from a {"box", "polygon", "native_tiles", "tile_size", "tile_overlap"} dict, None for the full frame"""
+        if not config:
+            return None
+        return cls(
+            box=config.get("box"),
+            polygon=config.get("polygon"),
+            native_tiles=config.get("native_tiles", False),
+            tile_size=config.get("tile_size") or FRAME_SIZE,
+            tile_overlap=config.get("tile_overlap", 0.2),
+        )
+
+    def to_config(self):
+        return {
+            "box": list(self.box),
+            "polygon": None if self.polygon is None else self.polygon.tolist(),
+            "native_tiles": self.native_tiles,
+            "tile_size": list(self.tile_size),
+            "tile_overlap": self.tile_overlap,
+        }
+
+    def crop_mask(self, scale_x, scale_y, x1, y1, x2, y2):
+        """Polygon mask of the crop [x1:x2, y1:y2] of a frame `scale` times the 480x270 frame"""
+        key = (scale_x, scale_y, x1, y1, x2, y2)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            points = self.polygon * (scale_x, scale_y) - (x1, y1)
+            cv2.fillPoly(mask, [np.round(points).astype(np.int32)], 255)
+            self.masks[key] = mask
+        return mask
+
+    def cut(self, image, scale_x, scale_y, x1, y1, x2, y2):
+        view = image[y1:y2, x1:x2]
+        if self.polygon is None:
+            return np.ascontiguousarray(view)
+        return cv2.bitwise_and(view, view, mask=self.crop_mask(scale_x, scale_y, x1, y1, x2, y2))
+
+    def views(self, frame, native=None):
+        """
+        Images to run YOLO on for one frame, as (image, (scale_x, scale_y, offset_x, offset_y))
+        where a view pixel maps to frame pixel (x * scale_x + offset_x, y * scale_y + offset_y)
+        """
+        x1, y1, x2, y2 = self.box
+        if not self.native_tiles or native is None:
+            return [(self.cut(frame, 1.0, 1.0, x1, y1, x2, y2), (1.0, 1.0, x1, y1))]
+
+        # Same box at the camera's native resolution
+        scale_x = native.shape[1] / self.frame_size[0]
+        scale_y = native.shape[0] / self.frame_size[1]
+        nx1, ny1 = int(x1 * scale_x), int(y1 * scale_y)
+        nx2, ny2 = int(np.ceil(x2 * scale_x)), int(np.ceil(y2 * scale_y))
+        tile_w, tile_h = self.tile_size
+        roi_views = []
+        for ty in tile_starts(ny1, ny2, tile_h, self.tile_overlap):
+            for tx in tile_starts(nx1, nx2, tile_w, self.tile_overlap):
+                bx2, by2 = min(tx + tile_w, nx2), min(ty + tile_h, ny2)
+                tile = self.cut(native, scale_x, scale_y, tx, ty, bx2, by2)
+                roi_views.append((tile, (1 / scale_x, 1 / scale_y, tx / scale_x, ty / scale_y)))
+        return roi_views
+
+    def view_count(self, native_size=None):
+        """Number of views() per frame, for a camera of native (width, height) resolution"""
+        if not self.native_tiles or native_size is None:
+            return 1
+        scale_x = native_size[0] / self.frame_size[0]
+        scale_y = native_size[1] / self.frame_size[1]
+        x1, y1, x2, y2 = self.box
+        columns = tile_starts(int(x1 * scale_x), int(np.ceil(x2 * scale_x)), self.tile_size[0], self.tile_overlap)
+        rows = tile_starts(int(y1 * scale_y), int(np.ceil(y2 * scale_y)), self.tile_size[1], self.tile_overlap)
+        return len(columns) * len(rows)
+
+    def merge(self, views, results):
+        """Map the detections of one frame's views back to frame coordinates, returns one (N, 6) array"""
+        mapped = []
+        for (_, (scale_x, scale_y, offset_x, offset_y)), boxes in zip(views, results):
+            if len(boxes) == 0:
+                continue
+            boxes = np.array(boxes, dtype=np.float32)
+            boxes[:, [0, 2]] = boxes[:, [0, 2]] * scale_x + offset_x
+            boxes[:, [1, 3]] = boxes[:, [1, 3]] * scale_y + offset_y
+            mapped.append(boxes)
+        if not mapped:
+            return np.empty((0, 6), dtype=np.float32)
+
+        boxes = np.concatenate(mapped)
+        if len(mapped) > 1:
+            boxes = non_max_suppression(boxes)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, self.frame_size[0] - 1)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, self.frame_size[1] - 1)
+
+        if self.polygon is not None and len(boxes):
+            centers = np.column_stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2))
+            boxes = boxes[points_in_polygon(self.polygon, centers)]
+        return boxes
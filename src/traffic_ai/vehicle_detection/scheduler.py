@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+
+
+class AdaptiveScheduler:
+    """
+    Picks the captured frames YOLO runs on from the camera rate, the measured cost and how close vehicles are to a zone.
+    Without `limit_to_cost` the measured cost is ignored (lossless replay)
+    """
+
+    def __init__(self, target_fps=10.0, idle_fps=3.0, near_zone_px=60, max_skip=10, smoothing=0.2,
+                 limit_to_cost=True):
+        self.target_fps = float(target_fps)
+        self.limit_to_cost = limit_to_cost
+        self.idle_fps = min(float(idle_fps), self.target_fps)
+        self.near_zone_px = near_zone_px
+        self.max_skip = max(1, int(max_skip))
+        self.smoothing = smoothing  # Weight of the newest sample in the moving averages
+        self.lock = threading.Lock()
+
+        self.camera_fps = None
+        self.last_capture = None
+        self.latency = {"inference": None, "tracking": None}  # Seconds per frame
+        self.activity = "idle"  # "idle" (no tracks), "tracking" or "near_zone"
+        self.skip = 1
+        self.last_detected = None  # Frame ID of the last frame sent to YOLO
+
+    def average(self, current, sample):
+        return sample if current is None else current + self.smoothing * (sample - current)
+
+    def record_capture(self, timestamp=None):
+        """Call once per captured frame to measure the camera's frame rate"""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self.lock:
+            if self.last_capture is not None and timestamp > self.last_capture:
+                self.camera_fps = self.average(self.camera_fps, 1.0 / (timestamp - self.last_capture))
+            self.last_capture = timestamp
+            self.update_skip()
+
+    def record_latency(self, stage, seconds, frames=1):
+        """Record how long `stage` ("inference" or "tracking") took for `frames` frames"""
+        with self.lock:
+            self.latency[stage] = self.average(self.latency[stage], seconds / max(1, frames))
+            self.update_skip()
+
+    def update_activity(self, zone_distances, detections=0):
+        """
+        Feed the distance of every current track to its nearest counting zone, and the
+        number of detections so new vehicles SORT has not confirmed yet are picked up quickly
+        """
+        if len(zone_distances) == 0:
+            activity = "tracking" if detections else "idle"
+        elif min(zone_distances) <= self.near_zone_px:
+            activity = "near_zone"
+        else:
+            activity = "tracking"
+        with self.lock:
+            self.activity = activity
+            self.update_skip()
+
+    def update_skip(self):
+        """Recompute how many captured frames go by per detected frame, called under the lock"""
+        if not self.camera_fps:
+            self.skip = 1
+            return
+
+        wanted_fps = {"near_zone": self.camera_fps, "tracking": self.target_fps, "idle": self.idle_fps}[self.activity]
+        skip = self.camera_fps / max(wanted_fps, 1e-3)
+
+        # Never plan more detections than the measured cost per frame allows
+        cost = sum(seconds for seconds in self.latency.values() if seconds is not None)
+        if cost > 0 and self.limit_to_cost:
+            skip = max(skip, self.camera_fps * cost)
+        self.skip = min(self.max_skip, max(1, math.ceil(skip - 1e-6)))
+
+    def should_detect(self, frame_id):
+        """True when the captured frame `frame_id` should go to YOLO, frames dropped upstream count as skipped"""
+        with self.lock:
+            if self.last_detected is None or frame_id < self.last_detected or frame_id - self.last_detected >= self.skip:
+                self.last_detected = frame_id
+                return True
+            return False
+
+    def status(self):
+        with self.lock:
+            return {
+                "activity": self.activity,
+                "skip": self.skip,
+                "camera_fps": round(self.camera_fps, 1) if self.camera_fps else None,
+                "detect_fps": round(self.camera_fps / self.skip, 1) if self.camera_fps else None,
+                "inference_ms": round(self.latency["inference"] * 1000, 1) if self.latency["inference"] else None,
+                "tracking_ms": round(self.latency["tracking"] * 1000, 1) if self.latency["tracking"] else None,
+            }
@@ -17,21 +17,10 @@
 """
 from __future__ import print_function
 
-import os
+# Tracker core only: importing this module needs numpy and an assignment solver (lapx or scipy).
+# The MOT benchmark demo and its matplotlib/skimage display live in sort_demo.py.
+import itertools
 import numpy as np
-import matplotlib
-
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
-
-import glob
-import time
-import argparse
-from filterpy.kalman import KalmanFilter
-
-np.random.seed(0)
 
 
 def linear_assignment(cost_matrix):
@@ -92,68 +81,185 @@ def convert_x_to_bbox(x, score=None):
         return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2., score]).reshape((1, 5))
 
 
-class KalmanBoxTracker(object):
+def convert_bboxes_to_z(bboxes):
     """
-    This class represents the internal state of individual tracked objects observed as bbox.
+    Vectorised convert_bbox_to_z: takes an (N,4+) array of [x1,y1,x2,y2] boxes and returns
+      an (N,4) array of [x,y,s,r] rows
     """
-    count = 0
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    return np.stack((bboxes[:, 0] + w / 2., bboxes[:, 1] + h / 2., w * h, w / h), axis=1)
 
-    def __init__(self, bbox):
+
+def convert_x_to_bboxes(x):
+    """
+    Vectorised convert_x_to_bbox: takes an (N,4+) array of [x,y,s,r] states and returns
+      an (N,4) array of [x1,y1,x2,y2] boxes
+    """
+    w = np.sqrt(x[:, 2] * x[:, 3])
+    h = x[:, 2] / w
+    return np.stack((x[:, 0] - w / 2., x[:, 1] - h / 2., x[:, 0] + w / 2., x[:, 1] + h / 2.), axis=1)
+
+
+class KalmanBoxTracks(object):
+    """
+    Kalman state of every track as a structure of arrays (row i is track i), predicted and updated in batches.
+    Velocities are per frame, a predict over dt frames moves the state dt steps at once.
+    """
+    # define constant velocity model
+    F = np.array(
+        [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+         [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.array(
+        [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    # give high uncertainty to the unobservable initial velocities
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    count = itertools.count()
+
+    def __init__(self, num_classes=80):
+        self.x = np.empty((0, 7))
+        self.P = np.empty((0, 7, 7))
+        self.ids = np.empty(0, dtype=int)
+        self.time_since_update = np.empty(0, dtype=int)
+        self.hits = np.empty(0, dtype=int)
+        self.hit_streak = np.empty(0, dtype=int)
+        self.age = np.empty(0, dtype=int)
+        self.det_index = np.empty(0, dtype=int)  # row of the detection each track was last matched to
+        # per-track class histogram: observations, summed score and first sighting (hit number) per class ID
+        self.class_counts = np.empty((0, num_classes), dtype=int)
+        self.class_scores = np.empty((0, num_classes))
+        self.class_first = np.empty((0, num_classes), dtype=int)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fit_classes(self, dets):
+        """
+        Widens the class histogram if dets carry a class ID beyond its current size.
         """
-        Initialises a tracker using initial bounding box.
+        if dets.shape[1] < 6 or len(dets) == 0:
+            return
+        needed = int(dets[:, 5].max()) + 1
+        extra = needed - self.class_counts.shape[1]
+        if extra > 0:
+            self.class_counts = np.pad(self.class_counts, ((0, 0), (0, extra)))
+            self.class_scores = np.pad(self.class_scores, ((0, 0), (0, extra)))
+            self.class_first = np.pad(self.class_first, ((0, 0), (0, extra)))
+
+    def record_classes(self, rows, dets):
         """
-        # define constant velocity model
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array(
-            [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
-             [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array(
-            [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
-
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[4:, 4:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
-
-        self.kf.x[:4] = convert_bbox_to_z(bbox)
-        self.time_since_update = 0
-        self.id = KalmanBoxTracker.count
-        KalmanBoxTracker.count += 1
-        self.history = []
-        self.hits = 0
-        self.hit_streak = 0
-        self.age = 0
-
-    def update(self, bbox):
+        Adds the class and score of observed [x1,y1,x2,y2,score,class] dets to the tracks in rows.
         """
-        Updates the state vector with observed bbox.
+        if dets.shape[1] < 6 or len(rows) == 0:
+            return
+        self.fit_classes(dets)
+        classes = dets[:, 5].astype(int)
+        new = self.class_counts[rows, classes] == 0
+        self.class_first[rows[new], classes[new]] = self.hits[rows[new]]
+        np.add.at(self.class_counts, (rows, classes), 1)
+        np.add.at(self.class_scores, (rows, classes), dets[:, 4])
+
+    def add(self, dets, det_indices):
         """
-        self.time_since_update = 0
-        self.history = []
-        self.hits += 1
-        self.hit_streak += 1
-        self.kf.update(convert_bbox_to_z(bbox))
+        Initialises new tracks from the given detections.
+        """
+        n = len(dets)
+        if n == 0:
+            return
+        x = np.zeros((n, 7))
+        x[:, :4] = convert_bboxes_to_z(dets)
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+        self.ids = np.concatenate((self.ids, [next(self.count) for _ in range(n)]))
+        zeros = np.zeros(n, dtype=int)
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+        self.det_index = np.concatenate((self.det_index, det_indices))
+        self.class_counts = np.concatenate((self.class_counts, np.zeros((n, self.class_counts.shape[1]), dtype=int)))
+        self.class_scores = np.concatenate((self.class_scores, np.zeros((n, self.class_scores.shape[1]))))
+        self.class_first = np.concatenate((self.class_first, np.zeros((n, self.class_first.shape[1]), dtype=int)))
+        self.record_classes(np.arange(len(self) - n, len(self)), dets)
+
+    def keep(self, mask):
+        """
+        Drops every track where mask is False.
+        """
+        for name in ('x', 'P', 'ids', 'time_since_update', 'hits', 'hit_streak', 'age', 'det_index',
+                     'class_counts', 'class_scores', 'class_first'):
+            setattr(self, name, getattr(self, name)[mask])
 
-    def predict(self):
+    def transition(self, dt):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Returns F and Q for a step of dt frames: positions advance by dt times the velocity and
+        the process noise grows with the time it accumulates over.
         """
-        if ((self.kf.x[6] + self.kf.x[2]) <= 0):
-            self.kf.x[6] *= 0.0
-        self.kf.predict()
-        self.age += 1
-        if (self.time_since_update > 0):
-            self.hit_streak = 0
-        self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
-        return self.history[-1]
+        if dt == 1:
+            return self.F, self.Q
+        F = self.F.copy()
+        F[[0, 1, 2], [4, 5, 6]] = dt
+        return F, self.Q * dt
+
+    def predict(self, dt=1):
+        """
+        Advances every state vector by dt frames and returns the predicted bounding box estimates.
+        """
+        if len(self) == 0:
+            return np.empty((0, 4))
+        F, Q = self.transition(dt)
+        self.x[(dt * self.x[:, 6] + self.x[:, 2]) <= 0, 6] = 0.
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+        self.age += dt
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += dt
+        return convert_x_to_bboxes(self.x)
+
+    def update(self, rows, dets, det_indices):
+        """
+        Updates the state vectors of the tracks in rows with their observed bboxes.
+        """
+        if len(rows) == 0:
+            return
+        x, P = self.x[rows], self.P[rows]
+        y = convert_bboxes_to_z(dets) - x @ self.H.T
+        PHt = P @ self.H.T
+        S = self.H @ PHt + self.R
+        # K = P H' S^-1, solved instead of inverting S
+        K = np.linalg.solve(S, PHt.transpose(0, 2, 1)).transpose(0, 2, 1)
+        self.x[rows] = x + (K @ y[:, :, None])[:, :, 0]
+        I_KH = np.eye(7) - K @ self.H
+        self.P[rows] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+        self.time_since_update[rows] = 0
+        self.hits[rows] += 1
+        self.hit_streak[rows] += 1
+        self.det_index[rows] = det_indices
+        self.record_classes(rows, dets)
 
     def get_state(self):
         """
-        Returns the current bounding box estimate.
+        Returns the current bounding box estimates.
+        """
+        return convert_x_to_bboxes(self.x)
+
+    def get_class(self):
+        """
+        Returns (majority class ID, mean score of that class) per track, (-1, 0.0) without class data.
         """
-        return convert_x_to_bbox(self.kf.x)
+        if self.class_counts.shape[1] == 0:
+            return np.full(len(self), -1), np.zeros(len(self))
+        rows = np.arange(len(self))
+        # most observations wins, ties go to the class that was seen first
+        latest = self.hits.max(initial=0) + 1
+        cls = (self.class_counts * (latest + 1) - self.class_first).argmax(axis=1)
+        count = self.class_counts[rows, cls]
+        score = np.divide(self.class_scores[rows, cls], count, out=np.zeros(len(self)), where=count > 0)
+        return np.where(count > 0, cls, -1), score
 
 
 def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
@@ -209,134 +315,58 @@ class Sort(object):
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        self.trackers = []
+        self.tracks = KalmanBoxTracks()
         self.frame_count = 0
 
-    def update(self, dets=np.empty((0, 5))):
+    def update(self, dets=np.empty((0, 5)), return_det_index=False, return_class=False, dt=1):
         """
         Params:
           dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+                 an optional 6th column holds the class ID, kept per track as a class histogram
+          return_det_index - append a column with the row in `dets` each track was matched to this frame
+          return_class - append the track's majority class ID and that class' mean score
+          dt - frames since the previous call when frames are skipped in between, max_age counts
+               frames, min_hits counts matched detections
         Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
         Returns the a similar array, where the last column is the object ID.
+        With both flags the rows are [x1,y1,x2,y2,ID,det_index,class,score] instead.
 
         NOTE: The number of objects returned may differ from the number of detections provided.
         """
         self.frame_count += 1
+        dets = np.asarray(dets, dtype=float)
         # get predicted locations from existing trackers.
-        trks = np.zeros((len(self.trackers), 5))
-        to_del = []
-        ret = []
-        for t, trk in enumerate(trks):
-            pos = self.trackers[t].predict()[0]
-            trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
-        trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-        for t in reversed(to_del):
-            self.trackers.pop(t)
+        trks = self.tracks.predict(max(1, int(dt)))
+        valid = ~np.any(np.isnan(trks), axis=1)
+        if not valid.all():
+            self.tracks.keep(valid)
+            trks = trks[valid]
         matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
 
         # update matched trackers with assigned detections
-        for m in matched:
-            self.trackers[m[1]].update(dets[m[0], :])
+        matched = matched.astype(int)
+        self.tracks.update(matched[:, 1], dets[matched[:, 0]], matched[:, 0])
 
         # create and initialise new trackers for unmatched detections
-        for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :])
-            self.trackers.append(trk)
-        i = len(self.trackers)
-        for trk in reversed(self.trackers):
-            d = trk.get_state()[0]
-            if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-                ret.append(np.concatenate((d, [trk.id + 1])).reshape(1, -1))  # +1 as MOT benchmark requires positive
-            i -= 1
-            # remove dead tracklet
-            if (trk.time_since_update > self.max_age):
-                self.trackers.pop(i)
-        if (len(ret) > 0):
-            return np.concatenate(ret)
-        return np.empty((0, 5))
-
-
-def parse_args():
-    """Parse input arguments."""
-    parser = argparse.ArgumentParser(description='SORT demo')
-    parser.add_argument('--display', dest='display', help='Display online tracker output (slow) [False]',
-                        action='store_true')
-    parser.add_argument("--seq_path", help="Path to detections.", type=str, default='data')
-    parser.add_argument("--phase", help="Subdirectory in seq_path.", type=str, default='train')
-    parser.add_argument("--max_age",
-                        help="Maximum number of frames to keep alive a track without associated detections.",
-                        type=int, default=1)
-    parser.add_argument("--min_hits",
-                        help="Minimum number of associated detections before track is initialised.",
-                        type=int, default=3)
-    parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
-    args = parser.parse_args()
-    return args
-
-
-if __name__ == '__main__':
-    # all train
-    args = parse_args()
-    display = args.display
-    phase = args.phase
-    total_time = 0.0
-    total_frames = 0
-    colours = np.random.rand(32, 3)  # used only for display
-    if (display):
-        if not os.path.exists('mot_benchmark'):
-            print(
-                '\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
-            exit()
-        plt.ion()
-        fig = plt.figure()
-        ax1 = fig.add_subplot(111, aspect='equal')
-
-    if not os.path.exists('output'):
-        os.makedirs('output')
-    pattern = os.path.join(args.seq_path, phase, '*', 'det', 'det.txt')
-    for seq_dets_fn in glob.glob(pattern):
-        mot_tracker = Sort(max_age=args.max_age,
-                           min_hits=args.min_hits,
-                           iou_threshold=args.iou_threshold)  # create instance of the SORT tracker
-        seq_dets = np.loadtxt(seq_dets_fn, delimiter=',')
-        seq = seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]
-
-        with open(os.path.join('output', '%s.txt' % (seq)), 'w') as out_file:
-            print("Processing %s." % (seq))
-            for frame in range(int(seq_dets[:, 0].max())):
-                frame += 1  # detection and frame numbers begin at 1
-                dets = seq_dets[seq_dets[:, 0] == frame, 2:7]
-                dets[:, 2:4] += dets[:, 0:2]  # convert to [x1,y1,w,h] to [x1,y1,x2,y2]
-                total_frames += 1
-
-                if (display):
-                    fn = os.path.join('mot_benchmark', phase, seq, 'img1', '%06d.jpg' % (frame))
-                    im = io.imread(fn)
-                    ax1.imshow(im)
-                    plt.title(seq + ' Tracked Targets')
-
-                start_time = time.time()
-                trackers = mot_tracker.update(dets)
-                cycle_time = time.time() - start_time
-                total_time += cycle_time
-
-                for d in trackers:
-                    print('%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1' % (frame, d[4], d[0], d[1], d[2] - d[0], d[3] - d[1]),
-                          file=out_file)
-                    if (display):
-                        d = d.astype(np.int32)
-                        ax1.add_patch(patches.Rectangle((d[0], d[1]), d[2] - d[0], d[3] - d[1], fill=False, lw=3,
-                                                        ec=colours[d[4] % 32, :]))
-
-                if (display):
-                    fig.canvas.flush_events()
-                    plt.draw()
-                    ax1.cla()
-
-    print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (
-    total_time, total_frames, total_frames / total_time))
-
-    if (display):
-        print("Note: to get real runtime results run without the option: --display")
+        unmatched_dets = np.asarray(unmatched_dets, dtype=int)
+        self.tracks.add(dets[unmatched_dets], unmatched_dets)
+
+        # newest tracks first, like the original per-tracker loop
+        order = np.arange(len(self.tracks))[::-1]
+        tracks = self.tracks
+        confirmed = (tracks.time_since_update[order] < 1) & (
+                (tracks.hit_streak[order] >= self.min_hits) | (self.frame_count <= self.min_hits))
+        rows = order[confirmed]
+        columns = [tracks.get_state()[rows], (tracks.ids[rows] + 1)[:, None]]  # +1 as MOT benchmark requires positive
+        if return_det_index:
+            columns.append(tracks.det_index[rows][:, None])
+        if return_class:
+            cls, score = tracks.get_class()
+            columns.extend((cls[rows][:, None], score[rows][:, None]))
+        ret = np.concatenate(columns, axis=1)
+
+        # remove dead tracklet
+        alive = tracks.time_since_update <= self.max_age
+        if not alive.all():
+            tracks.keep(alive)
+        return ret
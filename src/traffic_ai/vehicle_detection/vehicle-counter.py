@@ -5,7 +5,7 @@ from ultralytics import YOLO
 from ClassNames import ClassNames
 import cv2
 import cvzone
-from sort import *
+from sort import Sort
 import numpy as np
 import time
 from datetime import datetime
@@ -1,9 +1,15 @@
-import logging
-import requests.exceptions
-from ultralytics import YOLO
 from src.traffic_ai.vehicle_detection.ClassNames import ClassNames
-from src.traffic_ai.vehicle_detection.sort import *
+from src.traffic_ai.vehicle_detection.detector import create_detector, detector_options
+from src.traffic_ai.vehicle_detection.sort import Sort
 from src.traffic_ai.vehicle_detection.shared import detection_state
+from src.traffic_ai.vehicle_detection.frame_queue import DropOldestQueue
+from src.traffic_ai.vehicle_detection.counting_zones import ZoneCounter
+from src.traffic_ai.vehicle_detection.roi import RegionOfInterest
+from src.traffic_ai.vehicle_detection.scheduler import AdaptiveScheduler
+from src.traffic_ai.vehicle_detection.motion import MotionGate
+from src.traffic_ai.vehicle_detection.metrics import PipelineMetrics
+from src.traffic_ai.vehicle_detection.firebase_writer import FirebaseWriteBehind
+from src.traffic_ai.vehicle_detection.event_sinks import DEFAULT_EVENT_SINKS, EventDispatcher, create_sink, make_event
 import cv2
 import cvzone
 import numpy as np
@@ -13,84 +19,188 @@ import pandas as pd
 import firebase_admin
 from firebase_admin import credentials, db
 import threading
-import queue
-import io
-
-# Firebase setup (only initialize if not already done)
-if not firebase_admin._apps:
-    cred = credentials.Certificate(r"C:\Users\imper\Documents\capstone-project-v2\configs\traffic-logs-firebase-admin-sdk.json")
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://capstone-traffic-monitoring-default-rtdb.asia-southeast1.firebasedatabase.app/'
-    })
-
-today = pd.to_datetime(datetime.now()).date()
-previous_class_counts = {}
-firebase_queue = queue.Queue()
-
-def firebase_worker():
-    """Firebase worker thread"""
-    while True:
-        try:
-            task = firebase_queue.get(timeout=5)
-            if task is None:
-                firebase_queue.task_done()
-                break
-
-            path, action, data = task
-            ref = db.reference(path)
-            if action == 'push':
-                ref.push(data)
-            elif action == 'set':
-                ref.set(data)
-            elif action == 'update':
-                ref.update(data)
-
-            print(f"Firebase: {action} at {path}")
-            firebase_queue.task_done()
-        except queue.Empty:
-            continue
-        except Exception as e:
-            logging.error(f"Firebase error: {e}")
-            firebase_queue.task_done()
+
+FIREBASE_CREDENTIALS = r"C:\Users\imper\Documents\capstone-project-v2\configs\traffic-logs-firebase-admin-sdk.json"
+FIREBASE_DATABASE_URL = 'https://capstone-traffic-monitoring-default-rtdb.asia-southeast1.firebasedatabase.app/'
+FIREBASE_FLUSH_INTERVAL = 5.0  # Seconds between batched Firebase updates
+firebase_lock = threading.Lock()
+event_sinks_lock = threading.Lock()
+
+def init_firebase():
+    """Firebase setup on first use (only initialize if not already done), importing this module needs no credentials"""
+    with firebase_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+            firebase_admin.initialize_app(cred, {'databaseURL': FIREBASE_DATABASE_URL})
+
+firebase_writer = None  # FirebaseWriteBehind, see get_firebase_writer
+event_dispatchers = {}  # Sink configuration -> EventDispatcher, see get_event_dispatcher
+
+# Camera ID used by the single-camera endpoints, its counts keep the original Firebase paths
+DEFAULT_CAMERA_ID = "default"
+
+def firebase_update(updates):
+    """Write {path: value} to Firebase in one multi-path update of the database root"""
+    init_firebase()
+    db.reference("/").update(updates)
+
+def get_firebase_writer():
+    """Process wide Firebase write-behind outbox, started on first use"""
+    global firebase_writer
+    with firebase_lock:
+        if firebase_writer is None:
+            firebase_writer = FirebaseWriteBehind(firebase_update, flush_interval=FIREBASE_FLUSH_INTERVAL)
+        return firebase_writer.start()
+
+def stop_firebase_writer():
+    """Flush what is pending and stop the outbox thread, unsent writes stay on disk for the next start"""
+    if firebase_writer is not None:
+        firebase_writer.stop()
+
+def firebase_count_path(day, camera_id):
+    """Firebase path of a day's class counts for a camera"""
+    if camera_id == DEFAULT_CAMERA_ID:
+        return f"/detected_vehicle/{day}/vehicle_class_count"
+    return f"/detected_vehicle/{day}/cameras/{camera_id}/vehicle_class_count"
+
+def get_event_dispatcher(sinks):
+    """Process wide dispatcher of a sink configuration, cameras with the same sinks share their threads and connections"""
+    key = tuple(sinks)
+    with event_sinks_lock:
+        if key not in event_dispatchers:
+            writer = get_firebase_writer() if "firebase" in key else None
+            event_dispatchers[key] = EventDispatcher([create_sink(url, writer, firebase_count_path) for url in key])
+        return event_dispatchers[key]
+
+def stop_event_dispatchers():
+    """Write what the sinks still buffer and close them, before the Firebase outbox is stopped"""
+    with event_sinks_lock:
+        dispatchers = list(event_dispatchers.values())
+        event_dispatchers.clear()
+    for dispatcher in dispatchers:
+        dispatcher.stop()
+
+# Queued after the last frame of a recording, the stages pass it on once everything before it is done
+END_OF_STREAM = (None, None, None)
+
+def freeze(frame):
+    """Mark a frame read-only before it is shared, so consumers can keep the reference instead of copying"""
+    frame.flags.writeable = False
+    return frame
+
 
 class OptimizedDetectionPipeline:
-    def __init__(self, camera_source, detection_mode="processed"):
-        self.camera_source = camera_source
+    def __init__(self, camera_source, detection_mode="processed", batch_size=1,
+                 camera_id=DEFAULT_CAMERA_ID, detector=None, execution_mode="thread", counting_zones=None,
+                 roi=None, target_fps=10.0, motion_gating=True, persist=True, replay_fps=None,
+                 detector_backend="ultralytics", detector_model=None, event_sinks=None, detector_threads=None,
+                 lossless=None):
+        self.camera_source = camera_source  # Camera index/URL/video file, or an opened capture-like object
+        self.camera_id = camera_id
         self.detection_mode = detection_mode
+        self.execution_mode = execution_mode  # "thread" runs YOLO in-process, "process" in worker processes
         self.cap = None
+        self.detector = detector  # Shared between cameras when started by the PipelineManager
+        self.detector_backend = detector_backend  # "ultralytics", "onnxruntime" or "openvino"
+        self.detector_model = detector_model  # "fp32", "int8" or a model path, None for the FP32 model
+        self.detector_threads = detector_threads  # Intra-op threads of onnxruntime/openvino, None for one per core
         self.model = None
         self.classes = None
+        self.vehicle_type_lookup = None  # YOLO class ID -> our vehicle type
         self.tracker = None
+        self.last_tracked_id = None  # Frame ID of the last frame SORT saw, skipped frames are its dt
         self.running = False
         self.initialized = False
         
-        # Detection state
+        # Detection state. Published frames are read-only and replaced, never modified,
+        # so the stream getters hand out references without copying
+        self.roi = RegionOfInterest.from_config(roi)  # Road area sent to YOLO, None for the whole frame
+        self.native_frame = None  # Latest full resolution frame, only kept for native ROI tiles
         self.raw_frame = None
+        # The processed stream is the raw frame it was detected on plus an overlay of boxes and
+        # tracks, only drawn when a viewer asks for it (see get_stream_frame)
         self.processed_frame = None
+        self.processed_overlay = None
+        self.rendered_frame = (None, None)  # (frame ID, annotated frame) of the last render
+        # Monotonic frame IDs (the capture count), viewers only get sent frames with a new ID
+        self.raw_frame_id = 0
+        self.processed_frame_id = 0
         self.current_detections = []
         self.frame_lock = threading.Lock()
+        self.hub = None  # FrameBroadcastHub of this camera, set by the PipelineManager
         
         # Traffic monitoring
-        self.limits = [400, 135, 80, 135]  # Adjusted for 480x270 resolution
+        # Counting lines/polygons of this camera, the old single line when none are configured
+        self.zone_counter = ZoneCounter.from_config(counting_zones)
         self.time_track = {}
         self.current_ids = set()
         self.total_count = []
         self.vehicle_class_counts = {}
         self.vehicle_data = {}
         self.crossed_vehicles = set()  # Track which vehicles have crossed the line
+        self.today = pd.to_datetime(datetime.now()).date()  # Per pipeline so every camera resets its own counts at midnight
         
         # Performance optimization
-        self.frame_skip = 2  # Process every 2nd frame
+        # Batched inference sends `batch_size` frames to YOLO in one call
+        self.batch_size = max(1, int(batch_size))
+        # A lossless pipeline waits for the slowest stage instead of dropping frames, the default
+        # for recordings so their counts do not depend on how fast the machine is
+        self.lossless = replay_fps is not None if lossless is None else lossless
+        # Picks the frames YOLO runs on from the measured latency and how close vehicles are
+        # to a counting zone, on top of the drop-oldest queues when inference falls behind
+        self.scheduler = AdaptiveScheduler(target_fps=target_fps, limit_to_cost=not self.lossless)
+        # Skips YOLO on frames without motion in the road area while nothing is tracked
+        self.motion_gate = MotionGate(box=self.roi.box if self.roi is not None else None) if motion_gating else None
         self.frame_count = 0
         
-        # Firebase worker thread
-        self.firebase_thread = None
+        # Pipeline stages: capture -> inference -> annotation/publish, connected by
+        # bounded drop-oldest queues so a slow stage never stalls the camera read
+        self.capture_queue = DropOldestQueue(maxsize=max(2, self.batch_size), block=self.lossless)
+        self.result_queue = DropOldestQueue(maxsize=max(4, 2 * self.batch_size), block=self.lossless)
+        self.capture_thread = None
+        self.annotation_thread = None
         
+        # Per-stage timings, frame counters and queue depths for the /metrics endpoint
+        self.metrics = PipelineMetrics()
+        for name, stage_queue in (("capture_queue", self.capture_queue), ("result_queue", self.result_queue)):
+            self.metrics.gauge(f"{name}_depth", stage_queue.qsize)
+            self.metrics.counter(f"{name}_dropped", lambda stage_queue=stage_queue: stage_queue.dropped)
         
+        # Where crossings and exits go: "firebase", SQLAlchemy URLs and "parquet://<directory>"
+        # (see event_sinks.py). With persist=False counts stay local and nothing is written
+        self.persist = persist
+        self.event_sinks = list(event_sinks or DEFAULT_EVENT_SINKS) if persist else []
+        self.events = None
+        
+        # Frame rate of a recorded source: capture times become frame ID / replay_fps, so the
+        # scheduler and motion gate behave as they would live even when frames are read faster
+        self.replay_fps = replay_fps
+        # Set once the last frame of a recording went through every stage (live cameras reconnect instead)
+        self.stream_ended = threading.Event()
+        
+        
+    def count_path(self):
+        """Firebase path of today's class counts for this camera"""
+        return firebase_count_path(self.today, self.camera_id)
+
+
+    def emit_event(self, kind, record):
+        """Hand a crossing or exit to the event sinks, they write it in their next bulk insert"""
+        if self.events is not None:
+            self.events.emit(make_event(kind, self.today, record))
+
+
+    def capture_time(self, frame_id):
+        """Monotonic time of a captured frame, derived from its frame ID when replaying a recording"""
+        if self.replay_fps:
+            return frame_id / self.replay_fps
+        return time.monotonic()
+
+
     def load_existing_counts_from_firebase(self):
-        """Load existing vehicle counts from Firebase for today"""
+        """Load existing vehicle counts from Firebase for today, plus the counts the outbox has not sent yet"""
         try:
-            ref = db.reference(f"/detected_vehicle/{today}/vehicle_class_count")
+            ref = db.reference(self.count_path())
             existing_counts = ref.get()
             
             if existing_counts:
@@ -112,6 +222,13 @@ class OptimizedDetectionPipeline:
         except Exception as e:
             print(f"Error loading existing counts from Firebase: {e}")
             print("Starting with zero counts")
+        
+        # Crossings counted before a restart that are still in the outbox
+        pending = get_firebase_writer().pending_increments(self.count_path())
+        for vehicle_type, delta in pending.items():
+            self.vehicle_class_counts[vehicle_type] = self.vehicle_class_counts.get(vehicle_type, 0) + delta
+        if pending:
+            print(f"Added unsent counts from the outbox: {pending}")
 
 
     def get_persistent_total_count(self):
@@ -141,32 +258,50 @@ class OptimizedDetectionPipeline:
         try:
             print(f"Initializing optimized detection pipeline with source: {self.camera_source}")
             
-            # Initialize camera with better settings
-            self.cap = cv2.VideoCapture(self.camera_source)
+            self.cap = self.open_capture()
             if not self.cap.isOpened():
                 raise Exception(f"Cannot open camera: {self.camera_source}")
+            self.check_inference_slots()
             
-            # Optimize camera settings
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            self.cap.set(cv2.CAP_PROP_FPS, 30)
-            
-            # Load YOLO model
-            self.model = YOLO("src/traffic_ai/vehicle_detection/image-weights/yolo11n.onnx", task='detect')
+            # Load YOLO model unless a shared one was handed in
+            if self.detector is None:
+                self.detector = create_detector(self.detector_backend, self.detector_model,
+                                                **detector_options(self.detector_backend, self.detector_threads))
+            self.model = self.detector.model
             
             # Load classes
             self.classes = ClassNames()
+            self.vehicle_type_lookup = np.array(
+                [self.map_yolo_to_vehicle_type(name) for name in self.classes.class_names], dtype=object
+            )
             # Initialize counts for ALL vehicle types
             vehicle_types = ['car', 'truck', 'bus', 'motorbike', 'bicycle']
             self.vehicle_class_counts = {cls: 0 for cls in vehicle_types}
             
-            self.load_existing_counts_from_firebase()
+            if "firebase" in self.event_sinks:
+                init_firebase()
+                self.load_existing_counts_from_firebase()
 
             # Initialize tracker
-            self.tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
+            # max_age counts captured frames (2 s at 30 fps), not tracker updates, so a track
+            # expires after the same time however many frames the scheduler skips
+            self.tracker = Sort(max_age=60, min_hits=3, iou_threshold=0.3)
+            self.last_tracked_id = None
             
-            # Start Firebase worker thread
-            self.firebase_thread = threading.Thread(target=firebase_worker, daemon=True)
-            self.firebase_thread.start()
+            # Start the event sinks (and the Firebase outbox), shared by every camera
+            if self.event_sinks:
+                self.events = get_event_dispatcher(self.event_sinks)
+                for worker in self.events.workers:
+                    worker_status = worker.status
+                    self.metrics.gauge(f"sink_{worker.name}_pending", lambda s=worker_status: s()["pending"])
+                    self.metrics.counter(f"sink_{worker.name}_written", lambda s=worker_status: s()["written"])
+                    self.metrics.counter(f"sink_{worker.name}_dropped", lambda s=worker_status: s()["dropped"])
+            if "firebase" in self.event_sinks:
+                writer_status = get_firebase_writer().status
+                self.metrics.gauge("firebase_pending", lambda: writer_status()["pending"])
+                self.metrics.counter("firebase_flushed", lambda: writer_status()["flushed"])
+                self.metrics.counter("firebase_dropped", lambda: writer_status()["dropped"])
+                self.metrics.counter("firebase_coalesced", lambda: writer_status()["coalesced"])
             
             self.initialized = True
             print("Pipeline initialized successfully")
@@ -178,169 +313,234 @@ class OptimizedDetectionPipeline:
             self.initialized = False
             return False
     
+    def open_capture(self):
+        """Open the camera with better settings, a capture-like source is used as is"""
+        if hasattr(self.camera_source, "read"):
+            return self.camera_source
+        
+        cap = cv2.VideoCapture(self.camera_source)
+        if cap.isOpened():
+            # Optimize camera settings
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            cap.set(cv2.CAP_PROP_FPS, 30)
+        return cap
+
+
+    def check_inference_slots(self):
+        """A worker pool's ring must hold a whole batch of YOLO views, more is refused instead of split up"""
+        slots = getattr(self.detector, "slots", None)
+        if slots is None:
+            return
+        views = 1
+        if self.roi is not None:
+            native_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            views = self.roi.view_count(native_size if all(native_size) else None)
+        if self.batch_size * views > slots:
+            raise Exception(f"Batch size {self.batch_size} x {views} ROI views per frame needs more than the "
+                            f"{slots} frame slots of the inference workers")
+
+
     def check_date_change(self):
         """Check if date has changed and reset counts if needed"""
-        global today
         current_date = pd.to_datetime(datetime.now()).date()
         
-        if current_date != today:
-            print(f"📅 Date changed from {today} to {current_date}")
-            today = current_date
+        if current_date != self.today:
+            print(f"📅 Date changed from {self.today} to {current_date}")
+            self.today = current_date
             # Reset local counts for new day
             vehicle_types = ['car', 'truck', 'bus', 'motorbike', 'bicycle']
             self.vehicle_class_counts = {cls: 0 for cls in vehicle_types}
             self.total_count = []
             self.crossed_vehicles.clear()
+            self.zone_counter.reset_counts()
             print("🔄 Counts reset for new day")
             return True
         return False
 
 
-    def process_frame(self):
-        """Process a single frame with detection and tracking"""
-        if not self.running or not self.initialized:
-            return False
-            
-        self.check_date_change()
-
-        ret, frame = self.cap.read()
+    def read_frame(self):
+        """Read the next camera frame and resize it, returns None when the read fails"""
+        with self.metrics.time("capture_read"):
+            ret, frame = self.cap.read()
         if not ret:
-            return False
+            return None
         
         self.frame_count += 1
+        self.metrics.increment("frames_captured")
+        self.scheduler.record_capture(self.capture_time(self.frame_count))
         
-        # Resize frame
-        frame = cv2.resize(frame, (480, 270))
+        # Keep the camera's own resolution for ROI tiles of small, distant vehicles
+        self.native_frame = frame if self.roi is not None and self.roi.native_tiles else None
+        
+        # Resize frame, the resized frame is shared as is from here on
+        with self.metrics.time("resize"):
+            frame = freeze(cv2.resize(frame, (480, 270)))
         
         # Store raw frame for streaming
-        with self.frame_lock:
-            self.raw_frame = frame.copy()
+        with self.metrics.time("raw_store"):
+            with self.frame_lock:
+                self.raw_frame = frame
+                self.raw_frame_id = self.frame_count
+            self.publish_frame("raw")
         
-        #  Skip AI processing in raw mode
-        if self.detection_mode == "raw":
-            # Update shared state with raw frame only
+        return frame
+
+
+    def publish_frame(self, stream_type):
+        """Tell the broadcast hub a new frame is ready to be encoded for viewers"""
+        if self.hub is not None:
+            self.hub.publish(stream_type)
+
+
+    def publish_raw_only(self, frame, frame_id=None):
+        """Publish a frame without AI processing (raw mode)"""
+        # Update shared state with raw frame only
+        if self.camera_id == DEFAULT_CAMERA_ID:
             with detection_state.frame_lock:
-                detection_state.latest_frame = self.raw_frame.copy()
+                detection_state.latest_frame = frame
                 detection_state.latest_detections = []  # No detections in raw mode
-            
-            # Store same frame as processed (no annotations)
-            with self.frame_lock:
-                self.processed_frame = frame.copy()
-                self.current_detections = []
-            
-            time.sleep(0.016) # 60fps in raw mode
-            return True  # Skip all AI processing below
+        
+        # Store same frame as processed (no annotations)
+        with self.frame_lock:
+            self.processed_frame = frame
+            self.processed_overlay = None
+            self.processed_frame_id = self.frame_count if frame_id is None else frame_id
+            self.current_detections = []
+        self.publish_frame("processed")
+
+
+    def detect(self, frames, natives=None):
+        """Run YOLO on a list of frames in a single call, returns one detection array per frame"""
+        if self.roi is None:
+            with self.metrics.time("model_predict"):
+                return self.detector.predict(frames)
+        
+        # Only the ROI crop (or its native resolution tiles) of each frame goes to YOLO,
+        # all views of the batch still share one call
+        with self.metrics.time("roi_prepare"):
+            natives = natives or [None] * len(frames)
+            frame_views = [self.roi.views(frame, native) for frame, native in zip(frames, natives)]
+        with self.metrics.time("model_predict"):
+            results = self.detector.predict([image for views in frame_views for image, _ in views])
+        
+        with self.metrics.time("roi_merge"):
+            detections, offset = [], 0
+            for views in frame_views:
+                detections.append(self.roi.merge(views, results[offset:offset + len(views)]))
+                offset += len(views)
+        return detections
 
-        # Skip frames for performance
-        if self.frame_count % self.frame_skip != 0:
+
+    def needs_detection(self, frame, frame_id):
+        """Motion gate: while nothing is tracked, a frame without motion does not need YOLO"""
+        if self.motion_gate is None or self.scheduler.activity != "idle":
             return True
+        return self.motion_gate.has_motion(frame, self.capture_time(frame_id))
+
+
+    def detect_items(self, items):
+        """
+        Detect on (frame ID, frame, native frame) items in one YOLO call. Frames rejected by the
+        motion gate get an empty result, so SORT still predicts and ages out its tracks on them
+        """
+        results = [np.empty((0, 6), dtype=np.float32) for _ in items]
+        with self.metrics.time("motion_gate"):
+            moving = [i for i, (frame_id, frame, _) in enumerate(items) if self.needs_detection(frame, frame_id)]
+        self.metrics.increment("frames_motion_gated", len(items) - len(moving))
+        if not moving:
+            return results
         
-        try:
-            # Run YOLO detection
-            results = self.model.predict(
-                frame, 
-                classes=self.classes.classified_vehicle(), 
-                verbose=False, 
-                conf=0.3
-            )
-            
-            # Process detections
-            detections = np.empty((0, 5))
-            frame_detections = []
-            detected_objects = {}
+        started = time.perf_counter()
+        detections = self.detect([items[i][1] for i in moving], [items[i][2] for i in moving])
+        elapsed = time.perf_counter() - started
+        self.metrics.observe("inference", elapsed)
+        self.metrics.increment("frames_detected", len(moving))
+        self.scheduler.record_latency("inference", elapsed, len(moving))
+        for i, result in zip(moving, detections):
+            results[i] = result
+        return results
+
+
+    def update_tracking(self, frame, boxes, frame_id=None):
+        """Track and count one frame's detections ([x1, y1, x2, y2, conf, cls] rows)"""
+        started = time.perf_counter()
+        
+        with self.metrics.time("postprocess"):
+            # Process all detections at once
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+            xyxy = boxes[:, :4].astype(int)
+            confs = np.round(boxes[:, 4].astype(np.float64), 2)
+            # Map YOLO classes to our vehicle types
+            labels = self.vehicle_type_lookup[boxes[:, 5].astype(int)].tolist()
             
-            for r in results:
-                if r.boxes is not None:
-                    for box in r.boxes:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        w, h = x2 - x1, y2 - y1
-                        cls = int(box.cls[0])
-                        conf = round(float(box.conf[0]), 2)
-                        
-                        det_obj = self.classes.class_names[cls]
-                        
-                        # Map YOLO classes to our vehicle types
-                        vehicle_type = self.map_yolo_to_vehicle_type(det_obj)
-                        
-                        # Only show detections in frontend (not count them yet)
-                        frame_detections.append({
-                            "label": vehicle_type,
-                            "confidence": conf,
-                            "bbox": [x1, y1, x2, y2]
-                        })
-                        
-                        # For tracking
-                        current_array = np.array([x1, y1, x2, y2, conf])
-                        detections = np.vstack((detections, current_array))
-                        detected_objects[(x1, y1, x2, y2)] = vehicle_type
-                        
-                        # Only draw on processed frame, not for counting
-                        cvzone.cornerRect(frame, (x1, y1, w, h), l=9, rt=2)
+            # For tracking, SORT input built in one shot, the class ID column feeds each track's class histogram
+            detections = np.column_stack((xyxy, confs, boxes[:, 5]))
             
-            # Update tracking
-            tracked_objects = self.tracker.update(detections)
+            # Only show detections in frontend (not count them yet)
+            bboxes = xyxy.tolist()
+            frame_detections = [
+                {"label": label, "confidence": conf, "bbox": bbox}
+                for label, conf, bbox in zip(labels, confs.tolist(), bboxes)
+            ]
+        
+        with self.metrics.time("sort_update"):
+            # Update tracking, each track comes back with the row of the detection it matched
+            # and its majority class / mean confidence over the whole track
+            frame_id = self.frame_count if frame_id is None else frame_id
+            dt = 1 if self.last_tracked_id is None else max(1, frame_id - self.last_tracked_id)
+            self.last_tracked_id = frame_id
+            tracks = self.tracker.update(detections, return_det_index=True, return_class=True, dt=dt)
+            tracked_objects = tracks[:, :6].astype(int)
+            det_indices = tracked_objects[:, 5]
+            track_labels = self.vehicle_type_lookup[tracks[:, 6].astype(int)].tolist()
+            track_confs = np.round(tracks[:, 7], 2).tolist()
+        
+        with self.metrics.time("zone_counting"):
+            # Centroids of every track, tested against every zone on the move since the previous frame
+            centers_x = tracked_objects[:, 0] + (tracked_objects[:, 2] - tracked_objects[:, 0]) // 2
+            centers_y = tracked_objects[:, 1] + (tracked_objects[:, 3] - tracked_objects[:, 1]) // 2
+            centers = np.column_stack((centers_x, centers_y))
+            zone_crossings = self.zone_counter.update(tracked_objects[:, 4], centers, track_labels)
+            # Vehicles close to a zone make the scheduler detect every frame
+            self.scheduler.update_activity(self.zone_counter.distances(centers), len(boxes))
             
-            # Draw counting line
-            cv2.line(frame, (self.limits[0], self.limits[1]), 
-                    (self.limits[2], self.limits[3]), (0, 0, 255), 3)
+            self.current_ids = set(tracked_objects[:, 4].tolist())
             
-            # Process tracked objects
-            self.current_ids.clear()
-            for track in tracked_objects:
-                x1, y1, x2, y2, track_id = map(int, track)
-                w, h = x2 - x1, y2 - y1
-                cx, cy = x1 + w // 2, y1 + h // 2
-                
-                # Draw tracking info only if vehicle has crossed the line
-                if track_id in self.crossed_vehicles:
-                    cvzone.cornerRect(frame, (x1, y1, w, h), l=9, colorR=(0, 255, 0))  # Green for counted vehicles
-                    cvzone.putTextRect(frame, f"COUNTED ID: {track_id}", 
-                                     (max(0, x1), max(35, y1)), scale=1, thickness=1, offset=3)
-                else:
-                    cvzone.cornerRect(frame, (x1, y1, w, h), l=9, colorR=(255, 255, 0))  # Yellow for tracking
-                    cvzone.putTextRect(frame, f"TRACKING ID: {track_id}", 
-                                     (max(0, x1), max(35, y1)), scale=1, thickness=1, offset=3)
-                
-                self.current_ids.add(track_id)
-                
-                # Check line crossing - ONLY COUNT HERE
-                if (min(self.limits[0], self.limits[2]) < cx < max(self.limits[0], self.limits[2]) and 
-                    self.limits[1] - 20 < cy < self.limits[1] + 20 and 
-                    track_id not in self.crossed_vehicles):  # Only count if not already crossed
-                    
-                    self.handle_vehicle_crossing(track_id, detected_objects, frame_detections, cx, cy)
+            # Zone crossings - ONLY COUNT HERE, the first zone a vehicle crosses adds it to the class counts
+            for row, zone_name, direction in zone_crossings:
+                track_id = int(tracked_objects[row, 4])
+                if track_id not in self.crossed_vehicles:  # Only count if not already crossed
+                    # Majority class of the track, not just this frame's detection
+                    self.handle_vehicle_crossing(track_id, track_labels[row], track_confs[row], zone_name, direction)
             
             # Handle vehicle exits
             self.handle_vehicle_exits()
+        
+        with self.metrics.time("publish"):
+            # Update shared state for API - only show tracked detections, in detection order
+            tracked_detections = [frame_detections[i] for i in np.unique(det_indices).tolist()]
             
-            # Update shared state for API - only show tracked detections
-            tracked_detections = []
-            for det in frame_detections:
-                # Only show detections that are currently being tracked
-                for track in tracked_objects:
-                    x1, y1, x2, y2, track_id = map(int, track)
-                    det_x1, det_y1, det_x2, det_y2 = det["bbox"]
-                    
-                    # Check if detection matches tracked object (with some tolerance)
-                    if (abs(det_x1 - x1) < 20 and abs(det_y1 - y1) < 20 and 
-                        abs(det_x2 - x2) < 20 and abs(det_y2 - y2) < 20):
-                        tracked_detections.append(det)
-                        break
+            # The list is new every frame and never modified after this, so it is shared too
+            if self.camera_id == DEFAULT_CAMERA_ID:
+                with detection_state.frame_lock:
+                    detection_state.latest_frame = frame
+                    detection_state.latest_detections = tracked_detections
             
-            with detection_state.frame_lock:
-                detection_state.latest_frame = self.raw_frame.copy()
-                detection_state.latest_detections = tracked_detections.copy()
+            # Nothing is drawn here: the overlay is only rendered when someone watches the processed stream
+            overlay = (bboxes, [(x1, y1, x2, y2, track_id, track_id in self.crossed_vehicles)
+                                for x1, y1, x2, y2, track_id, _ in tracked_objects.tolist()])
             
-            # Store processed frame
+            # Store processed frame, only references are swapped under the lock
             with self.frame_lock:
-                self.processed_frame = frame.copy()
-                self.current_detections = tracked_detections.copy()
-            
-            return True
-            
-        except Exception as e:
-            print(f"Frame processing error: {e}")
-            return True
+                self.processed_frame = frame
+                self.processed_overlay = overlay
+                self.processed_frame_id = self.frame_count if frame_id is None else frame_id
+                self.current_detections = tracked_detections
+            self.publish_frame("processed")
+        
+        elapsed = time.perf_counter() - started
+        self.metrics.observe("update_tracking", elapsed)
+        self.scheduler.record_latency("tracking", elapsed)
     
 
     def map_yolo_to_vehicle_type(self, yolo_class_name):
@@ -378,8 +578,8 @@ class OptimizedDetectionPipeline:
         return 'car'
     
 
-    def handle_vehicle_crossing(self, track_id, detected_objects, frame_detections, cx, cy):
-        """Handle vehicle crossing the counting line - ONLY COUNT HERE"""
+    def handle_vehicle_crossing(self, track_id, det_obj_for_id, conf_for_id, zone=None, direction=None):
+        """Handle vehicle crossing a counting zone - ONLY COUNT HERE"""
         # Mark this vehicle as having crossed the line
         self.crossed_vehicles.add(track_id)
         
@@ -387,24 +587,8 @@ class OptimizedDetectionPipeline:
         current_time = time.strftime("%H:%M:%S")
         self.time_track[track_id] = {"time_in": current_time, "time_out": None}
         
-        # Determine vehicle class from closest detection
-        det_obj_for_id = "car"  # default
-        min_distance = float('inf')
-        
-        for det_box, det_class in detected_objects.items():
-            det_cx = (det_box[0] + det_box[2]) / 2
-            det_cy = (det_box[1] + det_box[3]) / 2
-            distance = ((cx - det_cx) ** 2 + (cy - det_cy) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                det_obj_for_id = det_class
-        
-        # Get confidence
-        conf_for_id = 0.0
-        for det in frame_detections:
-            if det["label"] == det_obj_for_id:
-                conf_for_id = det["confidence"]
-                break
+        det_obj_for_id = det_obj_for_id or "car"  # default
+        conf_for_id = float(conf_for_id)
         
         # Store vehicle data
         self.vehicle_data[track_id] = {
@@ -414,7 +598,10 @@ class OptimizedDetectionPipeline:
             "time_in": current_time,
             "time_out": None,
             "speed_ms": None,
-            "date": time.strftime("%Y-%m-%d %H:%M:%S")
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "camera_id": self.camera_id,
+            "zone": zone,
+            "direction": direction
         }
         
         # Update counts ONLY when crossing line
@@ -428,12 +615,12 @@ class OptimizedDetectionPipeline:
             self.vehicle_class_counts[det_obj_for_id] = 1
 
         total_persistent_count = self.get_persistent_total_count()
-        print(f"✅ VEHICLE COUNTED: {track_id} ({det_obj_for_id}) crossed line - Session: {len(self.total_count)}, Total Persistent: {total_persistent_count}")
+        print(f"✅ VEHICLE COUNTED: {track_id} ({det_obj_for_id}) crossed {zone} ({direction}) - Session: {len(self.total_count)}, Total Persistent: {total_persistent_count}")
         print(f"Current counts: {self.vehicle_class_counts}")
 
-        # Update Firebase with incremented count (this maintains persistence)
-        firebase_queue.put((f"/detected_vehicle/{today}/vehicle_class_count", 
-                        'update', {det_obj_for_id: self.vehicle_class_counts[det_obj_for_id]}))
+        # Send the crossing to the sinks (this maintains persistence), Firebase adds it to
+        # the stored count server side
+        self.emit_event("crossing", self.vehicle_data[track_id])
     
 
     def handle_vehicle_exits(self):
@@ -459,9 +646,8 @@ class OptimizedDetectionPipeline:
                     self.vehicle_data[ex_id]["time_out"] = self.time_track[ex_id]['time_out']
                     self.vehicle_data[ex_id]["speed_ms"] = speed_ms
                     
-                    # Save to Firebase
-                    firebase_queue.put((f"/detected_vehicle/{today}/individual_vehicle", 
-                                      'push', self.vehicle_data[ex_id]))
+                    # Save to the sinks
+                    self.emit_event("exit", self.vehicle_data[ex_id])
                     
                     print(f"🚗 Vehicle {ex_id} completed journey: {self.vehicle_data[ex_id]}")
                     
@@ -472,15 +658,68 @@ class OptimizedDetectionPipeline:
     
 
     def get_raw_frame(self):
-        """Get raw frame for streaming"""
+        """Get raw frame for streaming (read-only, copy it before drawing on it)"""
         with self.frame_lock:
-            return self.raw_frame.copy() if self.raw_frame is not None else None
+            return self.raw_frame
     
 
     def get_processed_frame(self):
-        """Get processed frame with annotations"""
+        """Get processed frame with annotations (read-only, copy it before drawing on it)"""
+        return self.get_stream_frame("processed")[1]
+    
+
+    def render_overlay(self, frame, overlay):
+        """Draw detections, counting zones and tracks on a copy of the frame they were found on"""
+        with self.metrics.time("render"):
+            bboxes, tracks = overlay
+            annotated = frame.copy()
+            for x1, y1, x2, y2 in bboxes:
+                cvzone.cornerRect(annotated, (x1, y1, x2 - x1, y2 - y1), l=9, rt=2)
+            
+            # Draw counting lines and zones
+            self.zone_counter.draw(annotated)
+            
+            for x1, y1, x2, y2, track_id, counted in tracks:
+                w, h = x2 - x1, y2 - y1
+                # Draw tracking info only if vehicle has crossed the line
+                if counted:
+                    cvzone.cornerRect(annotated, (x1, y1, w, h), l=9, colorR=(0, 255, 0))  # Green for counted vehicles
+                    cvzone.putTextRect(annotated, f"COUNTED ID: {track_id}", 
+                                     (max(0, x1), max(35, y1)), scale=1, thickness=1, offset=3)
+                else:
+                    cvzone.cornerRect(annotated, (x1, y1, w, h), l=9, colorR=(255, 255, 0))  # Yellow for tracking
+                    cvzone.putTextRect(annotated, f"TRACKING ID: {track_id}", 
+                                     (max(0, x1), max(35, y1)), scale=1, thickness=1, offset=3)
+            return freeze(annotated)
+    
+
+    def get_stream_frame(self, stream_type):
+        """
+        Get (frame ID, read-only frame) of the raw or processed stream. The processed frame is
+        rendered here, on the caller's thread (the broadcast hub's, only while someone watches),
+        once per frame ID
+        """
+        with self.frame_lock:
+            if stream_type == "raw":
+                return self.raw_frame_id, self.raw_frame
+            frame_id, frame, overlay = self.processed_frame_id, self.processed_frame, self.processed_overlay
+            rendered_id, rendered = self.rendered_frame
+        
+        if frame is None or overlay is None:
+            return frame_id, frame
+        if rendered_id == frame_id:
+            return frame_id, rendered
+        
+        rendered = self.render_overlay(frame, overlay)
+        with self.frame_lock:
+            self.rendered_frame = (frame_id, rendered)
+        return frame_id, rendered
+    
+
+    def get_frame_id(self, stream_type="processed"):
+        """Latest published frame ID of a stream"""
         with self.frame_lock:
-            return self.processed_frame.copy() if self.processed_frame is not None else None
+            return self.raw_frame_id if stream_type == "raw" else self.processed_frame_id
     
 
     def get_detections(self):
@@ -489,8 +728,102 @@ class OptimizedDetectionPipeline:
             return self.current_detections.copy()
     
 
+    def capture_loop(self):
+        """Capture stage: keep draining the camera so VideoCapture never serves stale frames"""
+        while self.running:
+            try:
+                frame = self.read_frame()
+            except Exception as e:
+                print(f"Capture error: {e}")
+                frame = None
+            
+            if frame is None:
+                if not self.running:
+                    break
+                if self.replay_fps is not None:
+                    # End of a recording: let the other stages finish what is queued
+                    print("End of recording reached")
+                    self.capture_queue.put(END_OF_STREAM)
+                    break
+                print("Camera disconnected, attempting reconnection...")
+                self.metrics.increment("camera_reconnects")
+                # A capture-like source cannot be reopened, it is read again as is
+                if self.cap and not hasattr(self.camera_source, "read"):
+                    self.cap.release()
+                time.sleep(2)
+                self.cap = self.open_capture()
+                continue
+            
+            # Drops the oldest frame if inference is behind (waits for it when lossless)
+            self.capture_queue.put((self.frame_count, frame, self.native_frame))
+
+
+    def inference_loop(self):
+        """Inference stage: run YOLO on the freshest captured frames"""
+        while self.running:
+            # Blocks until the capture stage has a frame (backpressure instead of sleeping)
+            item = self.capture_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            if item is END_OF_STREAM:
+                self.result_queue.put(END_OF_STREAM)
+                continue
+            
+            #  Skip AI processing in raw mode
+            if self.detection_mode == "raw":
+                frame_id, frame, _ = item
+                self.publish_raw_only(frame, frame_id)
+                continue
+            
+            # Batch whatever else is already waiting, never wait to fill a batch
+            items, ended = [item], False
+            while len(items) < self.batch_size:
+                extra = self.capture_queue.get_nowait()
+                if extra is None:
+                    break
+                if extra is END_OF_STREAM:
+                    ended = True
+                    break
+                items.append(extra)
+            
+            # Only the frames the scheduler asks for go to YOLO
+            due = [item for item in items if self.scheduler.should_detect(item[0])]
+            self.metrics.increment("frames_scheduler_skipped", len(items) - len(due))
+            items = due
+            
+            results = []
+            if items:
+                try:
+                    results = self.detect_items(items)
+                except Exception as e:
+                    print(f"Inference error: {e}")
+            
+            for (frame_id, frame, _), result in zip(items, results):
+                self.result_queue.put((frame_id, frame, result))
+            if ended:
+                self.result_queue.put(END_OF_STREAM)
+
+
+    def annotation_loop(self):
+        """Annotation stage: tracking, counting, drawing and publishing, in capture order"""
+        while self.running:
+            item = self.result_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            if item is END_OF_STREAM:
+                self.stream_ended.set()
+                continue
+            
+            frame_id, frame, result = item
+            try:
+                self.check_date_change()
+                self.update_tracking(frame, result, frame_id)
+            except Exception as e:
+                print(f"Frame processing error: {e}")
+
+
     def run(self):
-        """Main processing loop"""
+        """Main processing loop, blocks until the pipeline is stopped"""
         if not self.initialize():
             print("Failed to initialize pipeline")
             return
@@ -499,17 +832,19 @@ class OptimizedDetectionPipeline:
         print("Starting optimized detection loop...")
         print("🚨 DETECTION MODE: Vehicles will only be counted when they cross the virtual line!")
         
+        self.capture_queue.reopen()
+        self.result_queue.reopen()
+        self.stream_ended.clear()
+        
+        self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
+        self.annotation_thread = threading.Thread(target=self.annotation_loop, daemon=True)
+        self.capture_thread.start()
+        self.annotation_thread.start()
+        
+        # Inference runs on the calling thread
         while self.running:
             try:
-                if not self.process_frame():
-                    print("Camera disconnected, attempting reconnection...")
-                    if self.cap:
-                        self.cap.release()
-                    time.sleep(2)
-                    self.cap = cv2.VideoCapture(self.camera_source)
-                    continue
-                
-                time.sleep(0.033)  # ~30fps
+                self.inference_loop()
             except Exception as e:
                 if self.running:  # Only log if we're supposed to be running
                     print(f"Processing error: {e}")
@@ -517,12 +852,15 @@ class OptimizedDetectionPipeline:
         
         # Cleanup
         print("Cleaning up pipeline...")
+        self.capture_queue.close()
+        self.result_queue.close()
+        for stage in (self.capture_thread, self.annotation_thread):
+            if stage and stage.is_alive():
+                stage.join(timeout=5)
+        
         if self.cap:
             self.cap.release()
         
-        # Stop Firebase worker
-        firebase_queue.put(None)
-        
         print("Pipeline cleanup complete")
     
 
@@ -530,50 +868,6 @@ class OptimizedDetectionPipeline:
         """Stop the pipeline"""
         print("Stopping detection pipeline...")
         self.running = False
-
-# Global pipeline instance
-pipeline = None
-pipeline_lock = threading.Lock()
-
-def start_optimized_detection(camera_source, detection_mode="processed"):
-    """Start the optimized detection pipeline"""
-    global pipeline
-    
-    with pipeline_lock:
-        # Stop existing pipeline if running
-        if pipeline and pipeline.running:
-            pipeline.stop()
-            time.sleep(1)
-        
-        # Create new pipeline
-        pipeline = OptimizedDetectionPipeline(camera_source, detection_mode)
-        
-    # Run the pipeline (this will block until stopped)
-    pipeline.run()
-
-
-def get_pipeline():
-    """Get the global pipeline instance"""
-    with pipeline_lock:
-        return pipeline
-
-
-def stop_pipeline():
-    """Stop the current pipeline"""
-    global pipeline
-    
-    with pipeline_lock:
-        if pipeline:
-            pipeline.stop()
-            return True
-        return False
-    
-    
-def set_detection_mode(mode: str):
-    """Set detection mode for current pipeline"""
-    global pipeline
-    
-    with pipeline_lock:
-        if pipeline:
-            return pipeline.set_detection_mode(mode)
-        return False
\ No newline at end of file
+        # Wake up stages blocked on an empty queue
+        self.capture_queue.close()
+        self.result_queue.close()
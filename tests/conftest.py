@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules import each other as src.<...>, like the scripts do from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
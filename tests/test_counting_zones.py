@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from src.traffic_ai.vehicle_detection.counting_zones import CountingZone, ZoneCounter
+
+# The default counting line: drawn right to left, so moving down the screen crosses it inbound
+LINE = {"name": "main", "type": "line", "points": [[400, 135], [80, 135]], "direction": "both"}
+
+
+def test_line_crossing_direction():
+    zone = CountingZone.from_config(LINE)
+    previous = np.array([[200., 100.], [200., 170.], [200., 100.]])
+    current = np.array([[200., 170.], [200., 100.], [200., 120.]])
+
+    np.testing.assert_array_equal(zone.crossings(previous, current), [1, -1, 0])
+
+
+def test_line_crossing_is_tested_on_the_whole_move():
+    zone = CountingZone.from_config(LINE)
+    # Both ends far from the line, the segment between them crosses it
+    assert zone.crossings(np.array([[200., 20.]]), np.array([[240., 250.]]))[0] == 1
+    # Passes the line's height beyond its end point
+    assert zone.crossings(np.array([[450., 100.]]), np.array([[460., 170.]]))[0] == 0
+
+
+def test_resting_on_the_line_is_counted_once():
+    zone = CountingZone.from_config(LINE)
+    assert zone.crossings(np.array([[200., 100.]]), np.array([[200., 135.]]))[0] == 1
+    assert zone.crossings(np.array([[200., 135.]]), np.array([[200., 150.]]))[0] == 0
+
+
+def test_polygon_entry_and_exit():
+    zone = CountingZone("box", [[0, 0], [100, 0], [100, 100], [0, 100]], kind="polygon", direction="inbound")
+    previous = np.array([[-10., 50.], [50., 50.]])
+    current = np.array([[50., 50.], [150., 50.]])
+
+    np.testing.assert_array_equal(zone.crossings(previous, current), [1, 0])
+
+
+def test_invalid_zones_are_rejected():
+    with pytest.raises(ValueError):
+        CountingZone("line", [[0, 0], [1, 1], [2, 2]])
+    with pytest.raises(ValueError):
+        CountingZone("line", [[0, 0], [1, 1]], direction="sideways")
+    with pytest.raises(ValueError):
+        ZoneCounter([CountingZone("a", [[0, 0], [1, 1]]), CountingZone("a", [[0, 0], [2, 2]])])
+
+
+def test_zone_counter_counts_each_track_once_per_zone():
+    counter = ZoneCounter.from_config([LINE])
+    assert counter.update([1, 2], [[200, 100], [300, 170]], ["car", "truck"]) == []
+    assert counter.update([1, 2], [[200, 170], [300, 100]], ["car", "truck"]) == [
+        (0, "main", "inbound"), (1, "main", "outbound")
+    ]
+    # Back and forth again: already counted
+    assert counter.update([1], [[200, 100]], ["car"]) == []
+
+    counts = counter.snapshot()[0]
+    assert (counts["inbound"], counts["outbound"]) == (1, 1)
+    assert counts["by_class"] == {"car": 1, "truck": 1}
+
+
+def test_zone_counter_forgets_tracks_after_max_gap():
+    counter = ZoneCounter.from_config([LINE])
+    counter.max_gap = 2
+    counter.update([1], [[200, 100]], ["car"])
+    for _ in range(3):
+        counter.update([], [], [])
+    # Seen again below the line after the gap: no previous position to cross from
+    assert counter.update([1], [[200, 170]], ["car"]) == []
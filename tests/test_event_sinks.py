@@ -0,0 +1,84 @@
+import pytest
+
+from src.traffic_ai.vehicle_detection.event_sinks import EventDispatcher, SinkWorker, make_event
+
+
+class ListSink:
+    """Sink keeping what it wrote, can fail or run a hook while writing"""
+
+    name = "list"
+
+    def __init__(self):
+        self.rows = []
+        self.fail = False
+        self.during = None
+
+    def write(self, events):
+        if self.during is not None:
+            during, self.during = self.during, None
+            during()
+        if self.fail:
+            raise ConnectionError("offline")
+        self.rows.extend(event["record"]["vehicle_id"] for event in events)
+
+    def close(self):
+        pass
+
+
+def event(vehicle_id):
+    return make_event("exit", "2026-10-18", {"vehicle_id": vehicle_id, "class": "car"})
+
+
+@pytest.fixture
+def sink():
+    return ListSink()
+
+
+@pytest.fixture
+def worker(sink):
+    # A flush interval no test waits for, flush() is called directly
+    worker = SinkWorker(sink, "list", flush_interval=3600, batch_size=2, max_pending=3, backoff=1, max_backoff=1)
+    yield worker
+    worker.stopping.set()
+    worker.wakeup.set()
+
+
+def test_overflow_while_writing_drops_unwritten_events_only(worker, sink):
+    for i in range(3):
+        worker.add(event(i))
+    sink.during = lambda: [worker.add(event(i)) for i in range(3, 7)]
+
+    assert worker.flush() == 2
+    assert sink.rows == [0, 1]
+    # 2..6 arrived for 3 places: the oldest two were dropped, nothing written is sent again
+    assert worker.status()["dropped"] == 2
+    while worker.flush():
+        pass
+    assert sink.rows == [0, 1, 4, 5, 6]
+    assert worker.status()["written"] == 5
+
+
+def test_failed_write_puts_the_batch_back_in_order(worker, sink):
+    for i in range(3):
+        worker.add(event(i))
+    sink.fail = True
+    sink.during = lambda: worker.add(event(3))
+    with pytest.raises(ConnectionError):
+        worker.flush()
+
+    # 0, 1 back in front of 2, 3 with room for 3: the oldest is dropped
+    assert worker.status()["pending"] == 3
+    assert worker.status()["dropped"] == 1
+    sink.fail = False
+    while worker.flush():
+        pass
+    assert sink.rows == [1, 2, 3]
+
+
+def test_sinks_with_the_same_name_are_numbered():
+    dispatcher = EventDispatcher([ListSink(), ListSink()], flush_interval=3600)
+    dispatcher.emit(event(1))
+    dispatcher.stop()
+
+    assert set(dispatcher.status()) == {"list", "list_2"}
+    assert all(status["written"] == 1 for status in dispatcher.status().values())
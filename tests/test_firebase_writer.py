@@ -0,0 +1,139 @@
+import pytest
+
+from src.traffic_ai.vehicle_detection.firebase_writer import FirebaseWriteBehind, PushIdGenerator, increment
+
+
+class RecordingSend:
+    """Send callback that records every update and can fail or run a hook while sending"""
+
+    def __init__(self):
+        self.updates = []
+        self.fail = False
+        self.during = None
+
+    def __call__(self, updates):
+        if self.during is not None:
+            during, self.during = self.during, None
+            during()
+        if self.fail:
+            raise ConnectionError("offline")
+        self.updates.append(updates)
+
+
+@pytest.fixture
+def send():
+    return RecordingSend()
+
+
+@pytest.fixture
+def outbox(tmp_path, send):
+    writer = FirebaseWriteBehind(send, path=str(tmp_path / "outbox.db"))
+    yield writer
+    writer.conn.close()
+
+
+def test_push_ids_sort_in_creation_order():
+    generate = PushIdGenerator()
+    keys = [generate() for _ in range(2000)]
+    assert len(set(keys)) == len(keys)
+    assert keys == sorted(keys)
+    assert all(len(key) == 20 for key in keys)
+
+
+def test_increments_of_a_path_are_summed_into_one_row(outbox, send):
+    outbox.enqueue("/counts", "increment", {"car": 1, "truck": 1})
+    outbox.enqueue("/counts", "increment", {"car": 2})
+    outbox.enqueue("/counts", "increment", {"car": 1})
+
+    assert outbox.status()["pending"] == 2
+    assert outbox.status()["coalesced"] == 2
+    assert outbox.pending_increments("/counts") == {"car": 4, "truck": 1}
+
+    assert outbox.flush() == 2
+    assert send.updates == [{"counts/car": increment(4), "counts/truck": increment(1)}]
+    assert outbox.pending_increments("/counts") == {}
+
+
+def test_increment_during_a_send_is_not_lost(outbox, send):
+    outbox.enqueue("/counts", "increment", {"car": 3})
+    send.during = lambda: outbox.enqueue("/counts", "increment", {"car": 5})
+
+    outbox.flush()
+    assert send.updates[-1] == {"counts/car": increment(3)}
+    assert outbox.pending_increments("/counts") == {"car": 5}
+
+    outbox.flush()
+    assert send.updates[-1] == {"counts/car": increment(5)}
+    assert outbox.status()["pending"] == 0
+
+
+def test_failed_send_keeps_every_delta(outbox, send):
+    outbox.enqueue("/counts", "increment", {"car": 3})
+    send.fail = True
+    send.during = lambda: outbox.enqueue("/counts", "increment", {"car": 2})
+    with pytest.raises(ConnectionError):
+        outbox.flush()
+    assert outbox.pending_increments("/counts") == {"car": 5}
+
+    send.fail = False
+    outbox.flush()
+    assert send.updates == [{"counts/car": increment(5)}]
+
+
+def test_overlapping_paths_go_in_separate_batches(outbox, send):
+    outbox.enqueue("/day", "set", {"total": 1})
+    outbox.enqueue("/day/counts", "update", {"car": 2})
+    outbox.enqueue("/other", "update", {"x": 1})
+
+    assert outbox.flush() == 1
+    assert outbox.flush() == 2
+    assert send.updates == [{"day": {"total": 1}}, {"day/counts/car": 2, "other/x": 1}]
+
+
+def test_increment_after_a_set_of_the_same_path_waits_for_the_next_batch(outbox, send):
+    outbox.enqueue("/counts", "set", {"car": 7})
+    outbox.enqueue("/counts", "increment", {"car": 1})
+
+    outbox.flush()
+    outbox.flush()
+    assert send.updates == [{"counts": {"car": 7}}, {"counts/car": increment(1)}]
+
+
+def test_push_key_is_kept_when_a_batch_is_retried(outbox, send):
+    outbox.enqueue("/vehicles", "push", {"vehicle_id": 1})
+    send.fail = True
+    with pytest.raises(ConnectionError):
+        outbox.flush()
+    with outbox.lock:
+        attempted = outbox.next_batch()[1]
+
+    send.fail = False
+    outbox.flush()
+    assert {path.lstrip("/") for path in attempted} == set(send.updates[0])
+
+
+def test_pending_writes_survive_a_restart(tmp_path, send):
+    path = str(tmp_path / "outbox.db")
+    writer = FirebaseWriteBehind(send, path=path)
+    writer.enqueue("/counts", "increment", {"car": 2})
+    writer.enqueue("/vehicles", "push", {"vehicle_id": 1})
+    writer.conn.close()
+
+    reopened = FirebaseWriteBehind(send, path=path)
+    assert reopened.status()["pending"] == 2
+    reopened.enqueue("/counts", "increment", {"car": 1})
+    assert reopened.pending_increments("/counts") == {"car": 3}
+    assert reopened.flush() == 2
+    reopened.conn.close()
+
+
+def test_oldest_writes_are_dropped_past_max_pending(tmp_path, send):
+    writer = FirebaseWriteBehind(send, path=str(tmp_path / "outbox.db"), max_pending=3)
+    for i in range(5):
+        writer.enqueue("/vehicles", "update", {f"v{i}": i})
+
+    assert writer.status()["pending"] == 3
+    assert writer.status()["dropped"] == 2
+    writer.flush()
+    assert send.updates == [{"vehicles/v2": 2, "vehicles/v3": 3, "vehicles/v4": 4}]
+    writer.conn.close()
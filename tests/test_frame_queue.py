@@ -0,0 +1,64 @@
+import threading
+
+from src.traffic_ai.vehicle_detection.frame_queue import DropOldestQueue
+
+
+def test_full_queue_drops_the_oldest_item():
+    queue = DropOldestQueue(maxsize=2)
+    for item in range(5):
+        assert queue.put(item)
+
+    assert queue.dropped == 3
+    assert queue.get(timeout=0) == 3
+    assert queue.get(timeout=0) == 4
+    assert queue.get(timeout=0) is None
+
+
+def test_close_wakes_a_waiting_consumer():
+    queue = DropOldestQueue()
+    result = []
+    consumer = threading.Thread(target=lambda: result.append(queue.get(timeout=5)))
+    consumer.start()
+    queue.close()
+    consumer.join(timeout=1)
+
+    assert not consumer.is_alive()
+    assert result == [None]
+    assert not queue.put(1)
+
+
+def test_reopen_accepts_items_again():
+    queue = DropOldestQueue()
+    queue.put(1)
+    queue.close()
+    queue.reopen()
+
+    assert queue.qsize() == 0
+    assert queue.put(2)
+    assert queue.get_nowait() == 2
+
+
+def test_blocking_queue_waits_for_room_instead_of_dropping():
+    queue = DropOldestQueue(maxsize=1, block=True)
+    queue.put(1)
+    producer = threading.Thread(target=queue.put, args=(2,))
+    producer.start()
+    producer.join(timeout=0.2)
+    assert producer.is_alive()
+
+    assert queue.get(timeout=1) == 1
+    producer.join(timeout=1)
+    assert queue.get(timeout=1) == 2
+    assert queue.dropped == 0
+
+
+def test_close_releases_a_blocked_producer():
+    queue = DropOldestQueue(maxsize=1, block=True)
+    queue.put(1)
+    result = []
+    producer = threading.Thread(target=lambda: result.append(queue.put(2)))
+    producer.start()
+    queue.close()
+    producer.join(timeout=1)
+
+    assert result == [False]
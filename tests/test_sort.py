@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+# Test requirement (see requirements.txt), only the reference tracker below uses it
+from filterpy.kalman import KalmanFilter
+
+from src.traffic_ai.vehicle_detection.sort import (
+    KalmanBoxTracks, Sort, associate_detections_to_trackers, convert_bbox_to_z, convert_x_to_bbox
+)
+
+
+class ReferenceTracker(object):
+    """The original one-KalmanFilter-per-track KalmanBoxTracker of SORT"""
+
+    def __init__(self, bbox, track_id):
+        self.kf = KalmanFilter(dim_x=7, dim_z=4)
+        self.kf.F = np.array(
+            [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+             [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]])
+        self.kf.H = np.array(
+            [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]])
+        self.kf.R[2:, 2:] *= 10.
+        self.kf.P[4:, 4:] *= 1000.
+        self.kf.P *= 10.
+        self.kf.Q[-1, -1] *= 0.01
+        self.kf.Q[4:, 4:] *= 0.01
+        self.kf.x[:4] = convert_bbox_to_z(bbox)
+        self.time_since_update = 0
+        self.id = track_id
+        self.hits = 0
+        self.hit_streak = 0
+
+    def update(self, bbox):
+        self.time_since_update = 0
+        self.hits += 1
+        self.hit_streak += 1
+        self.kf.update(convert_bbox_to_z(bbox))
+
+    def predict(self):
+        if (self.kf.x[6] + self.kf.x[2]) <= 0:
+            self.kf.x[6] *= 0.0
+        self.kf.predict()
+        if self.time_since_update > 0:
+            self.hit_streak = 0
+        self.time_since_update += 1
+        return convert_x_to_bbox(self.kf.x)
+
+    def get_state(self):
+        return convert_x_to_bbox(self.kf.x)
+
+
+class ReferenceSort(object):
+    """The original Sort.update loop over ReferenceTrackers"""
+
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.trackers = []
+        self.frame_count = 0
+        self.next_id = 0
+
+    def update(self, dets):
+        self.frame_count += 1
+        trks = np.array([trk.predict()[0] for trk in self.trackers]).reshape(-1, 4)
+        matched, unmatched_dets, _ = associate_detections_to_trackers(dets, trks, self.iou_threshold)
+        for m in matched:
+            self.trackers[m[1]].update(dets[m[0], :])
+        for i in unmatched_dets:
+            self.trackers.append(ReferenceTracker(dets[i, :], self.next_id))
+            self.next_id += 1
+        ret = []
+        i = len(self.trackers)
+        for trk in reversed(self.trackers):
+            if trk.time_since_update < 1 and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+                ret.append(np.concatenate((trk.get_state()[0], [trk.id + 1])))
+            i -= 1
+            if trk.time_since_update > self.max_age:
+                self.trackers.pop(i)
+        return np.array(ret).reshape(-1, 5)
+
+
+def moving_boxes(frames, seed=0):
+    """Detections of a few boxes moving at constant speed with noise, missed detections and late arrivals"""
+    rng = np.random.default_rng(seed)
+    starts = np.array([[20, 40], [300, 60], [120, 200], [400, 180]], dtype=float)
+    speeds = np.array([[4, 1], [-3, 2], [2, -1.5], [-5, 0]])
+    sizes = np.array([[40, 30], [60, 40], [30, 30], [80, 50]], dtype=float)
+    appear = [0, 0, 5, 12]
+    for frame in range(frames):
+        dets = []
+        for i in range(len(starts)):
+            if frame < appear[i] or rng.random() < 0.15:
+                continue
+            x, y = starts[i] + speeds[i] * frame + rng.normal(0, 0.8, 2)
+            w, h = sizes[i]
+            dets.append([x, y, x + w, y + h, 0.5 + 0.5 * rng.random()])
+        yield np.array(dets).reshape(-1, 5)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_sort_matches_the_per_track_kalman_filters(seed):
+    tracker, reference = Sort(max_age=3, min_hits=3), ReferenceSort(max_age=3, min_hits=3)
+    id_offset = None
+    for dets in moving_boxes(60, seed):
+        got, expected = tracker.update(dets), reference.update(dets)
+        assert got.shape == expected.shape
+        if len(got):
+            if id_offset is None:
+                id_offset = got[0, 4] - expected[0, 4]
+            np.testing.assert_allclose(got[:, :4], expected[:, :4], rtol=1e-6, atol=1e-6)
+            np.testing.assert_array_equal(got[:, 4], expected[:, 4] + id_offset)
+
+        states = np.array([trk.kf.x[:, 0] for trk in reference.trackers]).reshape(-1, 7)
+        np.testing.assert_allclose(tracker.tracks.x, states, rtol=1e-6, atol=1e-6)
+
+
+def test_majority_class_per_track():
+    tracker = Sort(max_age=1, min_hits=1)
+    box = [10., 10., 60., 40.]
+    for cls, score in [(2, 0.9), (7, 0.6), (2, 0.7), (7, 0.5)]:
+        ret = tracker.update(np.array([box + [score, cls]]), return_class=True)
+    # 2 and 7 seen twice each, the class seen first wins with its mean score
+    assert ret[0, 5] == 2
+    assert ret[0, 6] == pytest.approx(0.8)
+
+
+def test_predict_over_dt_frames_moves_like_dt_single_steps():
+    stepped, skipped = KalmanBoxTracks(), KalmanBoxTracks()
+    for tracks in (stepped, skipped):
+        tracks.add(np.array([[10., 10., 50., 40., 0.9]]), np.array([0]))
+        tracks.x[0, 4:] = [3., -2., 5.]
+
+    for _ in range(4):
+        stepped.predict()
+    skipped.predict(4)
+
+    np.testing.assert_allclose(skipped.x, stepped.x)
+    assert skipped.age[0] == stepped.age[0] == 4
+    assert skipped.time_since_update[0] == stepped.time_since_update[0] == 4
+
+
+def test_track_survives_skipped_frames_and_expires_after_max_age_frames():
+    tracker = Sort(max_age=6, min_hits=1)
+    first = tracker.update(np.array([[0., 0., 40., 30., 0.9]]))
+    # Moving 3 px per frame, detected every 3rd frame
+    second = tracker.update(np.array([[0., 0., 40., 30., 0.9]]) + [3., 0., 3., 0., 0.], dt=3)
+    assert second[0, 4] == first[0, 4]
+
+    tracker.update(np.empty((0, 5)), dt=3)
+    assert len(tracker.tracks) == 1
+    tracker.update(np.empty((0, 5)), dt=4)
+    assert len(tracker.tracks) == 0
+
+
+def test_constant_velocity_track_keeps_its_id_when_frames_are_skipped():
+    tracker = Sort(max_age=60, min_hits=1)
+    ids = set()
+    for frame in range(0, 120, 4):
+        x = 8. * frame
+        ret = tracker.update(np.array([[x, 50., x + 60., 90., 0.9]]), dt=4 if frame else 1)
+        ids.update(ret[:, 4].tolist())
+    assert len(ids) == 1